@@ -0,0 +1,9 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from waterRPA_v2.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
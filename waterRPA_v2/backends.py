@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+# ---------------------------------------------------------
+# 截屏/键鼠后端
+# 引擎只通过这里访问屏幕和键鼠, 方便离线回放与基准测试
+# ---------------------------------------------------------
+_pyautogui = None
+
+def get_pyautogui():
+    global _pyautogui
+    if _pyautogui is None:
+        import pyautogui
+        pyautogui.FAILSAFE = False
+        pyautogui.PAUSE = 0
+        _pyautogui = pyautogui
+    return _pyautogui
+
+# --------------------------
+# 真实屏幕/键鼠 (pyautogui)
+# --------------------------
+class PyAutoGUICapture:
+    def grab(self, region=None):
+        return get_pyautogui().screenshot(region=region)
+
+class PyAutoGUIInput:
+    def moveTo(self, x, y, duration=0.0):
+        get_pyautogui().moveTo(x, y, duration=duration)
+
+    def mouseDown(self, button="left"):
+        get_pyautogui().mouseDown(button=button)
+
+    def mouseUp(self, button="left"):
+        get_pyautogui().mouseUp(button=button)
+
+    def scroll(self, clicks):
+        get_pyautogui().scroll(clicks)
+
+    def hotkey(self, *keys):
+        get_pyautogui().hotkey(*keys)
+
+    def paste(self, text):
+        import pyperclip
+        pyperclip.copy(text)
+        get_pyautogui().hotkey('ctrl', 'v')
+
+    def position(self):
+        return get_pyautogui().position()
+
+    def size(self):
+        return get_pyautogui().size()
+
+# --------------------------
+# 回放截屏: 依次返回预先准备好的帧 (PIL.Image 或 RGB ndarray)
+# --------------------------
+class ReplayCapture:
+    def __init__(self, frames, loop=True):
+        from PIL import Image
+        self.frames = [f if isinstance(f, Image.Image) else Image.fromarray(f) for f in frames]
+        self.loop = loop
+        self.index = 0
+        self.grabs = 0
+        self.lock = threading.Lock()
+
+    def current(self):
+        return self.frames[min(self.index, len(self.frames) - 1)]
+
+    def advance(self):
+        with self.lock:
+            if self.index + 1 < len(self.frames): self.index += 1
+            elif self.loop: self.index = 0
+
+    def grab(self, region=None):
+        with self.lock:
+            self.grabs += 1
+            frame = self.frames[min(self.index, len(self.frames) - 1)]
+        if region:
+            x, y, w, h = region
+            return frame.crop((x, y, x + w, y + h))
+        return frame.copy()
+
+    def size(self):
+        return self.frames[0].size
+
+# --------------------------
+# 记录型键鼠: 不产生真实输入, 只记录动作
+# --------------------------
+class RecordingInput:
+    def __init__(self, screen_size=(1920, 1080), on_action=None):
+        self.actions = []
+        self.pos = (0, 0)
+        self.screen_size = screen_size
+        self.on_action = on_action  # 每次动作后回调, 可用于推进 ReplayCapture
+
+    def _record(self, *action):
+        self.actions.append((time.perf_counter(),) + action)
+        if self.on_action: self.on_action(action)
+
+    def moveTo(self, x, y, duration=0.0):
+        self.pos = (x, y)
+        self._record("move", x, y)
+
+    def mouseDown(self, button="left"):
+        self._record("down", button)
+
+    def mouseUp(self, button="left"):
+        self._record("up", button)
+
+    def scroll(self, clicks):
+        self._record("scroll", clicks)
+
+    def hotkey(self, *keys):
+        self._record("hotkey", keys)
+
+    def paste(self, text):
+        self._record("paste", text)
+
+    def position(self):
+        return self.pos
+
+    def size(self):
+        return self.screen_size
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from .sessions import RESOLUTIONS, generate_session, load_session
+from .backends import ReplayCapture, RecordingInput
+
+# ---------------------------------------------------------
+# 离线基准测试
+#   python -m waterRPA_v2.bench --out bench.json
+#   python -m waterRPA_v2.bench --baseline bench.json   (与基线比较, 变慢则返回 1)
+#   python -m waterRPA_v2.bench --startup --res ""      (只测启动耗时)
+# ---------------------------------------------------------
+
+def summarize(samples):
+    s = sorted(samples)
+    n = len(s)
+    pick = lambda p: s[min(int(n * p / 100.0), n - 1)] * 1000
+    return {"n": n, "mean_ms": sum(s) / n * 1000, "p50_ms": pick(50), "p95_ms": pick(95), "min_ms": s[0] * 1000}
+
+def time_call(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return samples, result
+
+def hit_in_box(loc, box):
+    if loc is None or box is None: return loc is None and box is None
+    x, y, w, h = box
+    return x <= loc[0] <= x + w and y <= loc[1] <= y + h
+
+def make_engine(frames, **params):
+    from .engine import RPAEngine
+    engine = RPAEngine()
+    engine.capture_backend = ReplayCapture(frames)
+    engine.input_backend = RecordingInput(engine.capture_backend.size())
+    engine.click_hold = 0.0
+    for k, v in params.items(): setattr(engine, k, v)
+    return engine
+
+def bench_resolution(res, work_dir, repeat, results):
+    sess = generate_session(os.path.join(work_dir, res, "plain"), res, n_frames=1, n_templates=10, absent_ratio=0.0, seed=1)
+    scaled = generate_session(os.path.join(work_dir, res, "scaled"), res, n_frames=1, n_templates=1,
+                              scales=(1.15,), absent_ratio=0.0, seed=2)
+    frame = sess["frames"][0]
+    tpl_path = sess["templates"]["icon0"]
+    box = frame["targets"]["icon0"]
+    img_tasks = [{"type": 1.0, "value": p} for p in sess["templates"].values()]
+
+    # 1. 原尺寸命中
+    eng = make_engine([frame["image"]], min_scale=1.0, max_scale=1.0)
+    eng.load_and_precompute(img_tasks)
+    samples, loc = time_call(lambda: eng.find_target_optimized(tpl_path), repeat)
+    results[f"{res}/find_exact"] = dict(summarize(samples), ok=hit_in_box(loc, box))
+
+    # 2. 区域锁定后命中
+    x, y, w, h = box
+    rw, rh = 800, 600
+    rx = max(0, min(x - rw // 2, sess["resolution"][0] - rw))
+    ry = max(0, min(y - rh // 2, sess["resolution"][1] - rh))
+    eng.scan_region = (rx, ry, rw, rh)
+    samples, loc = time_call(lambda: eng.find_target_optimized(tpl_path), repeat)
+    results[f"{res}/find_region"] = dict(summarize(samples), ok=hit_in_box(loc, box))
+
+    # 3. 缩放命中 (目标放大 1.15 倍)
+    s_frame = scaled["frames"][0]
+    s_path = scaled["templates"]["icon0"]
+    eng = make_engine([s_frame["image"]], min_scale=0.8, max_scale=1.2)
+    eng.load_and_precompute([{"type": 1.0, "value": s_path}])
+    samples, loc = time_call(lambda: eng.find_target_optimized(s_path), repeat)
+    results[f"{res}/find_scaled"] = dict(summarize(samples), ok=hit_in_box(loc, s_frame["targets"]["icon0"]))
+
+    # 4. 未命中 (完整缩放扫描的最坏情况)
+    eng = make_engine([frame["image"]], min_scale=0.8, max_scale=1.2)
+    eng.load_and_precompute([{"type": 1.0, "value": s_path}])
+    samples, loc = time_call(lambda: eng.find_target_optimized(s_path), repeat)
+    results[f"{res}/find_miss"] = dict(summarize(samples), ok=loc is None)
+
+    # 5. 预加载 (0.5 - 2.0, 31 个缩放)
+    def precompute():
+        eng.img_cache = {}
+        eng.gray_cache = {}
+        eng.scaled_templates_cache = {}
+        eng.load_and_precompute(img_tasks)
+    eng = make_engine([frame["image"]], min_scale=0.5, max_scale=2.0)
+    samples, _ = time_call(precompute, max(repeat // 4, 1))
+    results[f"{res}/precompute"] = dict(summarize(samples), ok=len(eng.scaled_templates_cache) == len(img_tasks))
+
+    # 6. 多模板查找 (一次截图, 任一命中即返回)
+    eng = make_engine([frame["image"]], min_scale=1.0, max_scale=1.0)
+    eng.load_and_precompute(img_tasks)
+    paths = list(sess["templates"].values())[::-1]
+    samples, (path, loc) = time_call(lambda: eng.find_any(paths), repeat)
+    name = next((n for n, p in sess["templates"].items() if p == path), None)
+    results[f"{res}/find_any"] = dict(summarize(samples), ok=name is not None and hit_in_box(loc, frame["targets"][name]))
+
+    # 7. 模板库: 10 个同尺寸模板一次全部查找
+    samples, found = time_call(lambda: eng.find_all(paths), max(repeat // 4, 1))
+    results[f"{res}/find_all"] = dict(summarize(samples), templates=len(paths),
+                                      ok=all(hit_in_box(found[p], frame["targets"][n]) for n, p in sess["templates"].items()))
+
+    # 8. 完整 run_tasks 循环
+    eng = make_engine([frame["image"]], min_scale=1.0, max_scale=1.0)
+    samples, _ = time_call(lambda: eng.run_tasks(img_tasks), max(repeat // 4, 1))
+    clicks = [a for a in eng.input_backend.actions if a[1] == "down"]
+    results[f"{res}/run_tasks"] = dict(summarize(samples), steps=len(img_tasks),
+                                       ok=len(clicks) == len(img_tasks) * len(samples))
+
+def bench_recorded(session_dir, repeat, results):
+    sess = load_session(session_dir)
+    name = os.path.basename(os.path.normpath(session_dir))
+    for tpl_name, tpl_path in sess["templates"].items():
+        eng = make_engine([fr["image"] for fr in sess["frames"]])
+        eng.load_and_precompute([{"type": 1.0, "value": tpl_path}])
+        samples = []
+        ok = True
+        for fr in sess["frames"]:
+            s, loc = time_call(lambda: eng.find_target_optimized(tpl_path), repeat)
+            samples += s
+            ok = ok and hit_in_box(loc, fr["targets"].get(tpl_name))
+            eng.capture_backend.advance()
+        results[f"{name}/{tpl_name}"] = dict(summarize(samples), ok=ok)
+
+def run_probe(cmd, markers):
+    # 启动子进程并读取其打印的时间戳, 返回 {标记: 距启动的秒数}
+    env = dict(os.environ, RPA_STARTUP_PROBE="1")
+    t0 = time.time()
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True, encoding="utf-8", errors="replace", timeout=120)
+    found = {}
+    for line in proc.stdout.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] in markers:
+            found[parts[0]] = float(parts[1]) - t0
+    if len(found) < len(markers):
+        print(f"启动探针失败: {' '.join(cmd)}\n{proc.stderr[-800:]}", file=sys.stderr)
+        return None
+    return found
+
+def bench_startup(repeat, results):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = {"startup/first_paint": [], "startup/engine_ready": [], "startup/cli_first_action": []}
+    with tempfile.TemporaryDirectory() as work_dir:
+        script = os.path.join(work_dir, "startup.json")
+        with open(script, "w", encoding="utf-8") as f: json.dump([{"type": 7.0, "value": "ctrl+a"}], f)
+        for _ in range(repeat):
+            gui = run_probe([sys.executable, os.path.join(root, "run.py")], ("first_paint", "engine_ready"))
+            if gui:
+                runs["startup/first_paint"].append(gui["first_paint"])
+                runs["startup/engine_ready"].append(gui["engine_ready"])
+            cli = run_probe([sys.executable, os.path.join(root, "run_cli.py"), script, "--dry-run", "--no-watchdog", "--quiet"],
+                            ("first_action",))
+            if cli: runs["startup/cli_first_action"].append(cli["first_action"])
+    for key, samples in runs.items():
+        if samples: results[key] = dict(summarize(samples), ok=True)
+
+def collect_meta():
+    meta = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+            "platform": platform.platform(), "cpu_count": os.cpu_count()}
+    try:
+        import cv2, numpy
+        meta["opencv"] = cv2.__version__
+        meta["numpy"] = numpy.__version__
+    except ImportError: pass
+    return meta
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, cur in results.items():
+        base = baseline.get("results", {}).get(key)
+        if not base: continue
+        ratio = cur["p50_ms"] / base["p50_ms"] if base["p50_ms"] > 0 else 1.0
+        if ratio > 1.0 + tolerance or (base.get("ok") and not cur.get("ok")):
+            regressions.append((key, base["p50_ms"], cur["p50_ms"], ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="waterRPA 离线基准测试")
+    parser.add_argument("--res", default="1080p,1440p,4k", help="分辨率列表, 逗号分隔")
+    parser.add_argument("--frames", action="append", default=[], help="录制会话目录 (可多次指定)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--startup", action="store_true", help="测量界面首帧/引擎就绪/命令行首个动作的启动耗时")
+    parser.add_argument("--out", help="结果 JSON 输出路径")
+    parser.add_argument("--baseline", help="基线 JSON, 变慢超过容差时返回 1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的 p50 变慢比例")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for res in [r.strip() for r in args.res.split(",") if r.strip()]:
+            if res not in RESOLUTIONS:
+                print(f"未知分辨率: {res}", file=sys.stderr)
+                return 2
+            bench_resolution(res, work_dir, args.repeat, results)
+    for d in args.frames: bench_recorded(d, args.repeat, results)
+    if args.startup: bench_startup(max(args.repeat // 4, 1), results)
+
+    print(f"{'项目':<28}{'p50(ms)':>10}{'p95(ms)':>10}{'mean(ms)':>10}  ok")
+    for key, r in results.items():
+        print(f"{key:<30}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['mean_ms']:>10.2f}  {'Y' if r['ok'] else 'N'}")
+
+    report = {"meta": collect_meta(), "results": results}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f: baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for key, b, c, ratio in regressions:
+            print(f"!!! 回归 {key}: {b:.2f}ms -> {c:.2f}ms (x{ratio:.2f})")
+        if regressions: return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import mmap
+import struct
+
+from .config import IMAGE_TASK_TYPES
+
+# ---------------------------------------------------------
+# 脚本包 (.rpab): 任务 + 引擎参数 + 预先算好的灰度/缩放模板
+# 文件结构:
+#   8 字节魔数 | 8 字节头长度 (小端) | 头部 JSON | 按 64 字节对齐的 uint8 模板数据
+# 加载时整个文件 mmap, 模板直接以只读 ndarray 指向映射内存, 无需解码和缩放
+# 模板仍按原路径字符串索引, 换机器后路径不存在也能直接命中
+# ---------------------------------------------------------
+MAGIC = b"WRPAB001"
+ALIGN = 64
+
+class Bundle:
+    def __init__(self, tasks, params, min_scale, max_scale, gray, scaled, mm=None):
+        self.tasks = tasks
+        self.params = params
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.gray = gray      # 路径 -> 灰度模板
+        self.scaled = scaled  # 路径 -> [(scale, 模板), ...]
+        self.mm = mm          # 保持映射存活
+
+    def close(self):
+        if self.mm is not None:
+            self.gray, self.scaled = {}, {}
+            try: self.mm.close()
+            except BufferError: pass  # 仍有数组引用映射内存时交给 GC
+            self.mm = None
+
+def _pad(n):
+    return (ALIGN - n % ALIGN) % ALIGN
+
+def save_bundle(path, tasks, engine):
+    # engine 负责解码和缩放, 保证与运行时完全一致
+    from .engine import RUN_ONLY_PARAMS
+    engine.use_bundle(None)
+    engine.load_and_precompute(tasks)
+    # 追踪/断点路径跟机器有关, 不放进脚本包
+    params = {k: v for k, v in engine.get_params().items() if k not in RUN_ONLY_PARAMS}
+    return write_bundle(path, tasks, params, engine.min_scale, engine.max_scale,
+                        engine.gray_cache, engine.scaled_templates_cache)
+
+def write_bundle(path, tasks, params, min_scale, max_scale, gray_cache, scaled_cache):
+    import numpy as np
+    blobs = []
+    offset = 0
+    def add_blob(arr):
+        nonlocal offset
+        arr = np.ascontiguousarray(arr, dtype=np.uint8)
+        entry = [offset, arr.shape[0], arr.shape[1]]
+        blobs.append(arr)
+        offset += arr.nbytes + _pad(arr.nbytes)
+        return entry
+
+    templates = {}
+    for task in tasks:
+        p = str(task.get("value", ""))
+        if task.get("type") not in IMAGE_TASK_TYPES or p in templates or p not in gray_cache: continue
+        templates[p] = {
+            "gray": add_blob(gray_cache[p]),
+            "scaled": [[s] + add_blob(t) for s, t in scaled_cache.get(p, [])],
+        }
+
+    header = json.dumps({
+        "version": 1,
+        "tasks": tasks,
+        "params": params,
+        "min_scale": min_scale,
+        "max_scale": max_scale,
+        "templates": templates,
+    }, ensure_ascii=False).encode("utf-8")
+    head_len = len(MAGIC) + 8 + len(header)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * _pad(head_len))
+        for arr in blobs:
+            f.write(arr.tobytes())
+            f.write(b"\0" * _pad(arr.nbytes))
+    os.replace(tmp, path)
+    return len(templates)
+
+def load_bundle(path):
+    import numpy as np
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC: raise ValueError("不是有效的脚本包")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+        head_len = len(MAGIC) + 8 + header_len
+        data_start = head_len + _pad(head_len)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if header["templates"] else None
+
+    def view(entry):
+        off, h, w = entry
+        return np.frombuffer(mm, dtype=np.uint8, count=h * w, offset=data_start + off).reshape(h, w)
+
+    gray, scaled = {}, {}
+    for p, t in header["templates"].items():
+        gray[p] = view(t["gray"])
+        scaled[p] = [(s, view(e)) for s, *e in t["scaled"]]
+    from .engine import RUN_ONLY_PARAMS
+    params = {k: v for k, v in header.get("params", {}).items() if k not in RUN_ONLY_PARAMS}  # 旧版脚本包里可能有
+    return Bundle(header["tasks"], params, header["min_scale"], header["max_scale"], gray, scaled, mm)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import hashlib
+
+# ---------------------------------------------------------
+# 断点续跑: 定期把当前步骤/循环次数写入小状态文件,
+# 模板缓存以脚本包格式 (.rpab) 存在旁边, 续跑时直接 mmap 读回
+# ---------------------------------------------------------
+
+# 运行中会被引擎改写的字段, 不参与脚本比对
+VOLATILE_KEYS = ("scale",)
+
+def script_digest(tasks):
+    stable = [{k: v for k, v in t.items() if k not in VOLATILE_KEYS} if isinstance(t, dict) else t for t in tasks]
+    raw = json.dumps(stable, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+def cache_path_for(path):
+    return os.path.splitext(path)[0] + ".cache.rpab"
+
+def save_checkpoint(path, state):
+    # 先写临时文件再替换, 崩溃时不会留下半个文件
+    state = dict(state, saved_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def load_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def clear_checkpoint(path):
+    try: os.remove(path)
+    except OSError: pass
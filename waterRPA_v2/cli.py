@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+# ---------------------------------------------------------
+# 无界面运行器: 直接加载任务 JSON 调用 RPAEngine.run_tasks
+#   python run_cli.py script.json --config params.json --loop
+#   python run_cli.py --serve 8765 [script.json]   (本机 HTTP 控制接口, 见 control.py)
+# 退出码: 0 正常结束 / 1 被停止 / 2 引擎异常 / 3 脚本或参数错误
+# ---------------------------------------------------------
+EXIT_OK = 0
+EXIT_STOPPED = 1
+EXIT_ERROR = 2
+EXIT_BAD_INPUT = 3
+
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def print_summary(engine, stats, out=sys.stdout):
+    print("-" * 60, file=out)
+    print(f"步骤: {stats['steps']}  循环: {stats['loops']}  命中: {stats['hits']}  未命中: {stats['misses']}  "
+          f"耗时: {stats['elapsed']:.2f}s", file=out)
+    if stats.get("polls"):
+        rate = stats["polls"] / stats["poll_time"] if stats.get("poll_time") else 0.0
+        print(f"重试找图: {stats['polls']} 次  有效频率: {rate:.1f} 次/秒  退避等待: {stats['poll_wait']:.2f}s", file=out)
+    probes = stats.get("probe_fast", 0) + stats.get("probe_pass", 0)
+    if probes:
+        print(f"像素探针: {probes} 次  直接命中 {stats['probe_fast'] / probes:.0%}  "
+              f"需完整匹配 {stats['probe_pass'] / probes:.0%}", file=out)
+    spec = stats.get("lookahead_hits", 0) + stats.get("lookahead_stale", 0)
+    if spec:
+        print(f"预判找图: {spec} 次  复核通过 {stats['lookahead_hits'] / spec:.0%}", file=out)
+    if stats.get("settle_early"): print(f"自适应结算: {stats['settle_early']} 次提前结束", file=out)
+    if stats.get("shot_wait", 0) > 0.001: print(f"截图排队等待: {stats['shot_wait']:.2f}s (后台写盘跟不上)", file=out)
+    if stats.get("jumps"): print(f"颜色跳转: {stats['jumps']} 次", file=out)
+    if stats["stopped"]: print("状态: 被停止", file=out)
+    if stats["error"]: print(f"状态: 引擎异常 {stats['error']}", file=out)
+    print(f"{'步骤':<20}{'阶段':<10}{'次数':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}", file=out)
+    for task, phases in engine.metrics.snapshot().items():
+        for phase, st in phases.items():
+            print(f"{task:<20}{phase:<10}{st['count']:>6}{st['p50'] * 1000:>10.2f}"
+                  f"{st['p95'] * 1000:>10.2f}{st['p99'] * 1000:>10.2f}", file=out)
+
+def use_dry_run_backends(engine):
+    from PIL import Image
+    from .backends import ReplayCapture, RecordingInput
+    probe = bool(os.environ.get("RPA_STARTUP_PROBE"))
+    def on_action(action):
+        # 启动探针: 打印第一个动作的时间戳 (bench --startup 使用)
+        if probe and len(engine.input_backend.actions) == 1:
+            print(f"first_action {time.time():.6f}", flush=True)
+    engine.capture_backend = ReplayCapture([Image.new("RGB", (1920, 1080))])
+    engine.input_backend = RecordingInput(on_action=on_action)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="waterRPA 无界面运行器")
+    parser.add_argument("script", nargs="?", help="任务脚本 JSON 或脚本包 .rpab (--serve 时可省略)")
+    parser.add_argument("--config", help="引擎参数 JSON, 键名同 RPAEngine 属性 (confidence/min_scale/...)")
+    parser.add_argument("--loop", action="store_true", help="无限循环")
+    parser.add_argument("--region", help="识别区域 x,y,w,h")
+    parser.add_argument("--trace", help="写出 Chrome trace 文件")
+    parser.add_argument("--metrics", help="结束时导出耗时统计 JSON")
+    parser.add_argument("--log-file", action="store_true", help="同时写入 rpa_debug_log.txt")
+    parser.add_argument("--no-watchdog", action="store_true", help="不启动急停看门狗")
+    parser.add_argument("--quiet", action="store_true", help="不打印运行日志")
+    parser.add_argument("--force", action="store_true", help="脚本检查有问题时仍然运行")
+    parser.add_argument("--checkpoint", help="断点文件路径, 运行中定期记录进度")
+    parser.add_argument("--resume", action="store_true", help="从 --checkpoint 记录的断点继续")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="不直接运行, 在 127.0.0.1:PORT 提供控制接口 (0 = 随机端口)")
+    parser.add_argument("--token", help="控制接口校验口令 (请求头 X-RPA-Token)")
+    parser.add_argument("--flight", type=int, metavar="N", help="内存中保留最近 N 帧找图画面, 超时/急停/异常时写出")
+    parser.add_argument("--flight-dir", help="飞行记录输出目录 (默认 rpa_flight)")
+    parser.add_argument("--dry-run", action="store_true", help="空白回放画面 + 只记录键鼠动作, 不操作真实屏幕")
+    return parser
+
+def serve(engine, args, params):
+    from .control import EngineHost, ControlServer
+    host = EngineHost(engine, watchdog=not args.no_watchdog)
+    if args.script:
+        for p in host.load(args.script): print(f"第 {p['step']} 步: {p['msg']}", file=sys.stderr)
+        engine.apply_params(params)  # 命令行参数优先于脚本包自带参数
+    server = ControlServer(host, args.serve, args.token)
+    # 调度器靠这一行拿到实际端口
+    print(f"serving http://127.0.0.1:{server.port}", flush=True)
+    if not args.quiet:
+        def echo():
+            seq = 0
+            while True:
+                seq, lines = host.get_logs(seq, 30.0)
+                for l in lines: print(f"[{time.strftime('%H:%M:%S', time.localtime(l['time']))}] {l['msg']}", flush=True)
+        threading.Thread(target=echo, daemon=True).start()
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally:
+        host.stop()
+        server.server_close()
+    return EXIT_OK
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.script and args.serve is None: parser.error("需要脚本路径或 --serve")
+
+    from .config import GLOBAL_CONFIG
+    from .utils import enable_dpi_awareness
+    from .engine import RPAEngine, FailsafeWatchdog
+    from .loader import iter_json_array, validate_tasks
+    GLOBAL_CONFIG["log_to_file"] = args.log_file
+
+    try:
+        bundle = None
+        params = {}
+        if args.serve is not None: tasks = []
+        elif args.script.lower().endswith(".rpab"):
+            from .bundle import load_bundle
+            bundle = load_bundle(args.script)
+            tasks = bundle.tasks
+            params.update(bundle.params)
+        else:
+            tasks = list(iter_json_array(args.script))
+        if args.config: params.update(load_json(args.config))
+        problems = validate_tasks(tasks, set(bundle.gray) if bundle else ())
+        for idx, msg in problems: print(f"第 {idx + 1} 步: {msg}", file=sys.stderr)
+        if problems and not args.force: raise ValueError(f"脚本检查发现 {len(problems)} 处问题 (--force 忽略)")
+        if args.region: params["scan_region"] = args.region
+        if args.trace: params["enable_trace"] = True
+        if args.checkpoint: params["checkpoint_path"] = args.checkpoint
+        if args.flight is not None: params["flight_frames"] = args.flight
+        if args.flight_dir: params["flight_dir"] = args.flight_dir
+        if args.resume and not params.get("checkpoint_path"): raise ValueError("--resume 需要同时指定 --checkpoint")
+        if not args.dry_run: enable_dpi_awareness()  # 与界面版一致, 坐标按物理像素
+        engine = RPAEngine()
+        engine.apply_params(params)
+        if bundle: engine.use_bundle(bundle)
+        engine.trace_path = args.trace
+        if args.dry_run: use_dry_run_backends(engine)
+        if args.serve is not None: return serve(engine, args, params)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_BAD_INPUT
+
+    def on_log(msg):
+        if not args.quiet: print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+    watchdog = None
+    if not args.no_watchdog:
+        watchdog = FailsafeWatchdog(engine)
+        watchdog.start()
+    try:
+        stats = engine.run_tasks(tasks, args.loop, on_log, args.resume)
+    except KeyboardInterrupt:
+        engine.stop()
+        stats = engine.stats
+        stats["stopped"] = True
+    finally:
+        if watchdog: watchdog.kill()
+
+    if args.metrics:
+        try: engine.metrics.export(args.metrics)
+        except OSError as e: print(f"耗时统计导出失败: {e}", file=sys.stderr)
+    print_summary(engine, stats)
+
+    if stats["error"]: return EXIT_ERROR
+    if stats["stopped"]: return EXIT_STOPPED
+    return EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,5 +5,32 @@
 # ---------------------------------------------------------
 GLOBAL_CONFIG = {
     "log_to_file": False,
-    "log_to_ui": True
+    "log_to_ui": True,
+    "log_flush_ms": 200,      # 界面日志刷新间隔
+    "log_max_pending": 200,   # 两次刷新之间最多缓存的行数
+    "log_max_lines": 1000,    # 日志框最多保留行数
+    "metrics_to_file": False  # 运行结束时导出耗时统计
 }
+
+# ---------------------------------------------------------
+# 指令类型 (编码 -> 名称)
+# ---------------------------------------------------------
+TASK_TYPES = {
+    1.0: "左键单击",
+    2.0: "左键双击",
+    3.0: "右键单击",
+    4.0: "输入文本",
+    5.0: "等待(秒)",
+    6.0: "滚轮滑动",
+    7.0: "系统按键",
+    8.0: "鼠标悬停",
+    9.0: "截图保存",
+    10.0: "等待颜色",
+    11.0: "颜色跳转"
+}
+
+# 需要找图的指令
+IMAGE_TASK_TYPES = (1.0, 2.0, 3.0, 8.0)
+
+# 取色指令 (参数格式见 vision.parse_color_spec)
+COLOR_TASK_TYPES = (10.0, 11.0)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import threading
+import collections
+import urllib.request
+import urllib.error
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .utils import write_log
+
+# ---------------------------------------------------------
+# 本机控制接口: 用 HTTP 控制一个引擎, 方便一个控制进程编排多个运行器
+#   python run_cli.py --serve 8765 [脚本.json] [--dry-run]
+# 只监听 127.0.0.1, 可选 --token 校验 (请求头 X-RPA-Token)
+#   GET  /status                  运行状态 + 统计
+#   GET  /metrics[?raw=1]         分步骤耗时统计 (raw: 直方图原始分桶, 可合并)
+#   GET  /params                  当前引擎参数
+#   GET  /logs?since=N&timeout=S  长轮询取序号 > N 的日志
+#   GET  /events                  SSE 流: 日志行 + 每秒一次状态
+#   POST /load     {"path": ...} 或 {"tasks": [...]}
+#   POST /start    {"loop": false, "resume": false}
+#   POST /stop
+#   POST /params   {"confidence": 0.9, ...}   运行中也可修改, 下一步之前生效
+#   POST /shutdown
+# ---------------------------------------------------------
+LOG_RING = 2000
+
+class EngineHost:
+    def __init__(self, engine, watchdog=True):
+        self.engine = engine
+        self.watchdog = watchdog
+        self.tasks = []
+        self.script = None
+        self.thread = None
+        self.last_stats = {}
+        self.logs = collections.deque(maxlen=LOG_RING)  # (序号, 时间, 文本)
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.lock = threading.Lock()
+
+    def push_log(self, msg):
+        with self.cond:
+            self.seq += 1
+            self.logs.append((self.seq, time.time(), msg))
+            self.cond.notify_all()
+
+    def get_logs(self, since=0, timeout=0.0):
+        deadline = time.time() + timeout
+        with self.cond:
+            while self.seq <= since and time.time() < deadline:
+                self.cond.wait(deadline - time.time())
+            return self.seq, [{"seq": s, "time": t, "msg": m} for s, t, m in self.logs if s > since]
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def load(self, path=None, tasks=None):
+        from .loader import iter_json_array, validate_tasks
+        with self.lock:
+            if self.running(): raise RuntimeError("引擎运行中, 先停止再加载")
+            known = ()
+            if path and path.lower().endswith(".rpab"):
+                from .bundle import load_bundle
+                bundle = load_bundle(path)
+                self.engine.apply_params(bundle.params)
+                self.engine.use_bundle(bundle)
+                tasks = bundle.tasks
+                known = set(bundle.gray)
+            elif path:
+                tasks = list(iter_json_array(path))
+                self.engine.use_bundle(None)
+            if not isinstance(tasks, list): raise ValueError("需要 path 或 tasks")
+            self.tasks = tasks
+            self.script = path or "<inline>"
+            problems = validate_tasks(tasks, known)
+        self.push_log(f"已加载 {len(tasks)} 条指令: {self.script}")
+        return [{"step": idx + 1, "msg": msg} for idx, msg in problems]
+
+    def start(self, loop=False, resume=False):
+        with self.lock:
+            if self.running(): raise RuntimeError("引擎已在运行")
+            if not self.tasks: raise ValueError("没有加载脚本")
+            self.thread = threading.Thread(target=self._run, args=(list(self.tasks), loop, resume),
+                                           name="engine-host", daemon=True)
+            self.engine.is_running = True  # 线程真正启动前 status 也显示运行中
+            self.engine.stats, self.last_stats = {}, {}
+            self.engine.metrics.reset()
+            self.thread.start()
+
+    def _run(self, tasks, loop, resume):
+        from .engine import FailsafeWatchdog
+        dog = None
+        if self.watchdog:
+            dog = FailsafeWatchdog(self.engine)
+            dog.start()
+        try:
+            self.last_stats = self.engine.run_tasks(tasks, loop, self.push_log, resume)
+        except Exception as e:
+            write_log(f"控制接口运行失败: {e}")
+            self.push_log(f"引擎异常: {e}")
+        finally:
+            if dog: dog.kill()
+
+    def stop(self, wait=5.0):
+        self.engine.stop()
+        t = self.thread
+        if t is not None: t.join(wait)
+        return not self.running()
+
+    def set_params(self, params):
+        # 运行中的修改排队到下一步之前生效, 返回值里 pending 为尚未生效的部分
+        pending = self.engine.update_params(params)
+        p = self.params()
+        p["pending"] = sorted(pending)
+        return p
+
+    def status(self):
+        eng = self.engine
+        stats = dict(eng.stats) if eng.stats else dict(self.last_stats)
+        return {"running": self.running() or eng.is_running, "script": self.script, "tasks": len(self.tasks),
+                "step": eng.cur_step, "cur_task": eng.cur_task, "stats": stats, "log_seq": self.seq}
+
+    def params(self):
+        p = self.engine.get_params()
+        if p.get("scan_region"): p["scan_region"] = list(p["scan_region"])
+        return p
+
+    def metrics(self, raw=False):
+        return self.engine.metrics.dump() if raw else self.engine.metrics.snapshot()
+
+class ControlHandler(BaseHTTPRequestHandler):
+    server_version = "waterRPA"
+
+    def log_message(self, fmt, *args): pass
+
+    def send_json(self, code, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        if not n: return {}
+        data = json.loads(self.rfile.read(n).decode("utf-8"))
+        if not isinstance(data, dict): raise ValueError("请求体应为 JSON 对象")
+        return data
+
+    def authorized(self):
+        token = self.server.token
+        if token and self.headers.get("X-RPA-Token") != token:
+            self.send_json(403, {"error": "token 错误"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.authorized(): return
+        url = urlparse(self.path)
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        host = self.server.host
+        try:
+            if url.path == "/status": return self.send_json(200, host.status())
+            if url.path == "/metrics": return self.send_json(200, host.metrics(q.get("raw") == "1"))
+            if url.path == "/params": return self.send_json(200, host.params())
+            if url.path == "/logs":
+                seq, lines = host.get_logs(int(q.get("since", 0)), min(float(q.get("timeout", 0)), 60.0))
+                return self.send_json(200, {"seq": seq, "lines": lines})
+            if url.path == "/events": return self.stream_events(host)
+            self.send_json(404, {"error": f"未知路径: {url.path}"})
+        except ValueError as e: self.send_json(400, {"error": str(e)})
+
+    def do_POST(self):
+        if not self.authorized(): return
+        host = self.server.host
+        path = urlparse(self.path).path
+        try:
+            body = self.read_json()
+            if path == "/load":
+                return self.send_json(200, {"problems": host.load(body.get("path"), body.get("tasks"))})
+            if path == "/start":
+                host.start(bool(body.get("loop", False)), bool(body.get("resume", False)))
+                return self.send_json(200, host.status())
+            if path == "/stop": return self.send_json(200, {"stopped": host.stop(float(body.get("wait", 5.0)))})
+            if path == "/params": return self.send_json(200, host.set_params(body))
+            if path == "/shutdown":
+                self.send_json(200, {"ok": True})
+                host.stop()
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            self.send_json(404, {"error": f"未知路径: {path}"})
+        except RuntimeError as e: self.send_json(409, {"error": str(e)})
+        except (OSError, ValueError) as e: self.send_json(400, {"error": str(e)})
+
+    def stream_events(self, host):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        since = host.seq
+        last_status = 0.0
+        try:
+            while not self.server.closing:
+                since, lines = host.get_logs(since, 1.0)
+                out = [f"event: log\ndata: {json.dumps(l, ensure_ascii=False)}\n\n" for l in lines]
+                if time.time() - last_status >= 1.0:
+                    out.append(f"event: status\ndata: {json.dumps(host.status(), ensure_ascii=False)}\n\n")
+                    last_status = time.time()
+                if out:
+                    self.wfile.write("".join(out).encode("utf-8"))
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError): pass
+
+class ControlServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host, port=0, token=None):
+        super().__init__(("127.0.0.1", port), ControlHandler)
+        self.host = host
+        self.token = token
+        self.closing = False
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def server_close(self):
+        self.closing = True
+        super().server_close()
+
+# ---------------------------------------------------------
+# 客户端: 控制进程 / 调度器使用
+# ---------------------------------------------------------
+class ControlError(Exception):
+    pass
+
+class ControlClient:
+    def __init__(self, url, token=None, timeout=10.0):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def call(self, method, path, body=None, timeout=None):
+        data = json.dumps(body or {}, ensure_ascii=False).encode("utf-8") if method == "POST" else None
+        req = urllib.request.Request(self.url + path, data=data, method=method)
+        req.add_header("Content-Type", "application/json")
+        if self.token: req.add_header("X-RPA-Token", self.token)
+        try:
+            with urllib.request.urlopen(req, timeout=timeout or self.timeout) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            try: msg = json.loads(e.read().decode("utf-8")).get("error", e.reason)
+            except Exception: msg = e.reason
+            raise ControlError(f"{path}: {msg}") from e
+        except (OSError, ValueError) as e:
+            raise ControlError(f"{path}: {e}") from e
+
+    def status(self): return self.call("GET", "/status")
+    def metrics(self, raw=False): return self.call("GET", "/metrics?raw=1" if raw else "/metrics")
+    def params(self): return self.call("GET", "/params")
+    def logs(self, since=0, timeout=0.0):
+        return self.call("GET", f"/logs?since={since}&timeout={timeout}", timeout=self.timeout + timeout)
+    def load(self, path=None, tasks=None): return self.call("POST", "/load", {"path": path, "tasks": tasks})
+    def start(self, loop=False, resume=False): return self.call("POST", "/start", {"loop": loop, "resume": resume})
+    def stop(self): return self.call("POST", "/stop")
+    def set_params(self, **params): return self.call("POST", "/params", params)
+    def shutdown(self): return self.call("POST", "/shutdown")
@@ -4,10 +4,7 @@ import os
 import time
 import ctypes
 import threading
-import pyautogui
-import pyperclip
 import traceback
-from PIL import Image
 
 # Check for psutil
 try:
@@ -17,7 +14,11 @@ except ImportError:
     HAS_PSUTIL = False
 
 # Windows API
-GetAsyncKeyState = ctypes.windll.user32.GetAsyncKeyState
+try:
+    GetAsyncKeyState = ctypes.windll.user32.GetAsyncKeyState
+    HAS_WINAPI = True
+except AttributeError:
+    HAS_WINAPI = False
 try:
     GetCurrentProcessorNumber = ctypes.windll.kernel32.GetCurrentProcessorNumber
     GetCurrentProcessorNumber.restype = ctypes.c_ulong
@@ -25,11 +26,84 @@ try:
 except:
     HAS_KERNEL_CPU = False
 
-pyautogui.FAILSAFE = False 
-pyautogui.PAUSE = 0
+from .utils import write_log, get_output_path, detect_dpi_scale
+from .config import GLOBAL_CONFIG, TASK_TYPES, IMAGE_TASK_TYPES
+from .metrics import MetricsRecorder
+from .tracing import Tracer
+from .scheduler import AdaptivePoller
+from .vision import frame_thumb, thumb_changed, TemplateBank, make_probe, probe_at, probe_grid
+from .vision import parse_color_spec, color_bbox, sample_colors, colors_match, format_rgb
+from .backends import PyAutoGUICapture, PyAutoGUIInput, get_pyautogui
+from .bundle import write_bundle, load_bundle
+from .recorder import FlightRecorder
+from .writer import ImageWriter, FORMATS, format_for, save_options
+from .checkpoint import script_digest, cache_path_for, save_checkpoint, load_checkpoint, clear_checkpoint
+
+# --------------------------
+# 可配置的引擎参数 (名称 -> 类型转换)
+# --------------------------
+def _to_bool(v):
+    if isinstance(v, str): return v.strip().lower() in ("1", "true", "yes", "on")
+    return bool(v)
+
+def _to_region(v):
+    if v in (None, "", [], ()): return None
+    if isinstance(v, str): v = v.split(",")
+    region = tuple(int(float(x)) for x in v)
+    if len(region) != 4: raise ValueError("区域需要 x,y,w,h 四个数")
+    return region
 
-from .utils import write_log
-from .config import GLOBAL_CONFIG
+def _to_path(v):
+    return str(v) if v else None
+
+ENGINE_PARAMS = {
+    "confidence": float,
+    "min_scale": float,
+    "max_scale": float,
+    "scan_region": _to_region,
+    "dodge_x1": int,
+    "dodge_y1": int,
+    "dodge_x2": int,
+    "dodge_y2": int,
+    "enable_dodge": _to_bool,
+    "enable_double_dodge": _to_bool,
+    "double_dodge_wait": float,
+    "move_duration": float,
+    "click_hold": float,
+    "settlement_wait": float,
+    "timeout_val": float,
+    "enable_tm_stop": _to_bool,
+    "enable_tr_stop": _to_bool,
+    "enable_key_stop": _to_bool,
+    "enable_trace": _to_bool,
+    "checkpoint_path": _to_path,
+    "checkpoint_interval": float,
+    "poll_latency": float,
+    "poll_cpu": float,
+    "match_threads": int,
+    "probe_filter": _to_bool,
+    "scale_calibration": _to_bool,
+    "scale_recal": int,
+    "match_downscale": float,
+    "lookahead": int,
+    "adaptive_settle": _to_bool,
+    "settle_stable": float,
+    "shot_format": str,
+    "shot_quality": int,
+    "shot_compress": int,
+    "shot_queue": int,
+    "flight_frames": int,
+    "flight_dir": _to_path,
+}
+# 只在启动时生效的参数, 运行中修改会留到下次启动
+RUN_ONLY_PARAMS = ("enable_trace", "checkpoint_path", "flight_frames")
+SCALE_STEP = 0.05  # 缩放扫描步长
+CALIBRATE_HITS = 2 # 连续几次命中同一缩放后才收窄扫描范围
+SPEC_MARGIN = 8    # 预判命中复核时在目标四周多截的像素
+SETTLE_BOX = (320, 240)  # 自适应结算: 观察点击点周围这么大的区域
+SETTLE_POLL = 0.01       # 自适应结算的采样间隔
+SETTLE_THRESHOLD = 4.0   # 观察区域采样更密 (一块对应 8x8 像素), 按钮高亮这类小变化也要算上
+FLIGHT_MIN_INTERVAL = 30.0  # 两次超时写盘的最短间隔, 循环里反复超时不会刷屏; 急停/异常总是写
 
 # --------------------------
 # 独立看门狗线程
@@ -45,7 +119,7 @@ class FailsafeWatchdog(threading.Thread):
         write_log(">>> 看门狗线程启动")
         while self.running:
             try:
-                if self.engine.enable_key_stop:
+                if self.engine.enable_key_stop and HAS_WINAPI:
                     if GetAsyncKeyState(0x1B) & 0x8000: 
                         self.trigger_stop("用户按下了【ESC键】")
                         return
@@ -54,8 +128,8 @@ class FailsafeWatchdog(threading.Thread):
                         return
 
                 if self.engine.enable_tr_stop:
-                    x, y = pyautogui.position()
-                    w, h = pyautogui.size()
+                    x, y = self.engine.input_backend.position()
+                    w, h = self.engine.input_backend.size()
                     if x > (w - 10) and y < 10:
                         self.trigger_stop("检测到鼠标【右上角急停】")
                         return
@@ -81,7 +155,7 @@ class FailsafeWatchdog(threading.Thread):
         if not self.engine.stop_requested:
             write_log(f">>> 看门狗触发: {reason}")
             self.engine.log(f"!!! {reason} -> 停止 !!!")
-            self.engine.stop() 
+            self.engine.stop(reason)
             try: ctypes.windll.user32.MessageBeep(0xFFFFFFFF)
             except: pass
 
@@ -119,11 +193,72 @@ class RPAEngine:
         self.enable_key_stop = True
         
         self.callback_msg = None
-        self.opencv_available = False 
+        self.capture_backend = PyAutoGUICapture()
+        self.input_backend = PyAutoGUIInput()
+        self.opencv_available = None  # None = 尚未检测, 首次使用或后台预热时再导入 cv2
+        self.ready_lock = threading.Lock()
+        self.warmup_done = threading.Event()
         self.img_cache = {} 
+        self.gray_cache = {}
         self.scaled_templates_cache = {}
+        self.template_mtime = {}  # 路径 -> 读取时的修改时间, 文件变了才重新加载
+        self.template_bank = TemplateBank()  # (路径, 缩放) -> 模板, 多模板查找时按尺寸分组
+        self.bank_entries = {}  # 路径 -> 已放入模板库的 [(缩放, 模板)]
+        self.probe_filter = False  # 只能提前确认命中, 目标不在时反而多花探针的时间, 默认关闭
+        self.probe_cache = {}  # 路径 -> 像素探针
+        self.last_hit = {}     # 路径 -> 上次命中的中心点 (屏幕坐标)
+        self.probe_weak = {}   # 路径 -> 整帧探针连续无效次数, 达到 3 次后只查上次位置
+        self.color_specs = {}  # 取色指令参数 -> 解析结果
+        self.scale_calibration = True
+        self.scale_recal = 5      # 校准后连续未找到该次数, 下一次恢复完整缩放扫描
+        self.learned_scale = {}   # 路径 -> 命中时的缩放 (1.0 = 原尺寸), 跨运行保留, 保存脚本时写入 scale 字段
+        self.scale_misses = {}    # 路径 -> 校准后连续未找到次数
+        self.scale_candidate = {} # 路径 -> (待确认的缩放, 连续命中次数)
+        self.session_scale = None # 最近一次命中的缩放, 未校准的模板优先试附近的缩放
+        self.match_downscale = 1.0  # 截图先缩小该倍数再匹配 (模板按 100% 缩放截取时用), 0 = 按系统 DPI 自动
+        self.dpi_scale = None       # 自动模式下检测到的系统缩放, 首次使用时读取
+        self.frame_factor = 1.0     # 当前这帧实际缩小的倍数, 命中坐标乘回去得到物理像素
+        self.lookahead = 2          # 点击按住/结算期间, 在同一帧上预先找后面几步的图
+        self.last_frame = None      # 最近一次找图用的 (灰度画面, 偏移 x, 偏移 y, 缩小倍数)
+        self.cur_tasks = None
+        self.spec_hits = {}         # 路径 -> 预判到的屏幕坐标, 用到时只截目标附近复核
+        self.spec_cancel = None
+        self.spec_future = None
+        self.spec_pool = None
+        self.adaptive_settle = False  # 结算等待改为观察画面: 变化后稳定下来即继续, 原等待时间作为上限
+        self.settle_stable = 0.05     # 画面保持不变这么久算稳定
+        self.last_click = None        # 最近一次点击的屏幕坐标, 输入文本后观察它附近
+        self.shot_format = "png"      # 截图指令给的是目录时生成文件的格式: png / jpg / webp / bmp
+        self.shot_quality = 90        # jpg / webp 质量
+        self.shot_compress = 6        # png 压缩级别 0-9, 越小越快文件越大
+        self.shot_queue = 8           # 后台待写截图上限, 满了截图指令等待
+        self.image_writer = None
+        self.flight_frames = 0        # 飞行记录保留的帧数, 0 = 关闭
+        self.flight_dir = None        # 飞行记录输出目录, None 时放在日志旁的 rpa_flight
+        self.flight = None
+        self.flight_last = {}         # 触发类型 -> 上次写盘时间
+        self.stop_reason = None       # 看门狗急停的原因, 手动停止为 None
+        self.bundle = None
+        self.pending_params = {}  # 运行中修改的参数, 在两步之间统一生效
+        self.params_lock = threading.Lock()
+        self.quiet_marks = threading.local()  # on = True 的线程不记分阶段耗时
+        self.metrics = MetricsRecorder()
+        self.stats = {}
+        self.cur_task = "-"
+        self.enable_trace = False
+        self.trace_path = None  # None 时自动生成文件名
+        self.tracer = Tracer()
+        self.checkpoint_path = None  # 断点文件, None 表示不记录
+        self.checkpoint_interval = 5.0
+        self.poll_latency = 0.2  # 重试找图的最大间隔 (目标出现后最迟多久发现)
+        self.poll_cpu = 0.5      # 重试找图最多占用的 CPU 比例
+        self.last_thumb = None
+        self.match_threads = min(os.cpu_count() or 1, 8)
+        self.match_pool = None
+        self.match_pool_size = 0
+        self.frame_changed = True
+        self.cur_step = 0
 
-        self.check_engine_status()
         self.set_high_priority()
 
     def set_high_priority(self):
@@ -134,22 +269,90 @@ class RPAEngine:
         except: pass
 
     def check_engine_status(self):
+        with self.ready_lock:
+            if self.opencv_available is not None: return self.opencv_available
+            try:
+                import cv2
+                import numpy
+                # Simple check if imported modules are working
+                img = numpy.zeros((10, 10, 3), dtype=numpy.uint8)
+                cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+                self.opencv_available = True
+                write_log("OpenCV/NumPy 引擎就绪。")
+            except:
+                self.opencv_available = False
+                write_log("OpenCV 引擎不可用。")
+        return self.opencv_available
+
+    def warmup(self):
+        # 后台提前导入重量级模块, 窗口此时已经显示, 首次启动任务不再卡顿
+        t0 = time.perf_counter()
+        self.check_engine_status()
         try:
-            import cv2
-            import numpy
-            # Simple check if imported modules are working
-            img = numpy.zeros((10, 10, 3), dtype=numpy.uint8)
-            cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-            self.opencv_available = True
-            write_log("OpenCV/NumPy 引擎就绪。")
-        except:
-            self.opencv_available = False
-            write_log("OpenCV 引擎不可用。")
-
-    def stop(self):
+            from PIL import Image
+            get_pyautogui()
+        except Exception as e: write_log(f"预热失败: {e}")
+        write_log(f"引擎预热完成 ({(time.perf_counter() - t0) * 1000:.0f}ms)")
+        self.warmup_done.set()
+
+    def start_warmup(self):
+        threading.Thread(target=self.warmup, name="warmup", daemon=True).start()
+
+    def stop(self, reason=None):
+        self.stop_reason = reason
         self.stop_requested = True
         self.is_running = False
 
+    def convert_params(self, params):
+        converted = {}
+        for name, value in params.items():
+            if name not in ENGINE_PARAMS: raise ValueError(f"未知参数: {name}")
+            try: converted[name] = ENGINE_PARAMS[name](value)
+            except (TypeError, ValueError) as e: raise ValueError(f"参数 {name} 格式错误: {value}") from e
+        return converted
+
+    def apply_params(self, params):
+        # 先全部转换校验, 再统一赋值, 避免只改了一半
+        # 整体设置参数时丢掉上次运行里没来得及生效的修改, 否则下次启动会被旧值覆盖
+        converted = self.convert_params(params)
+        with self.params_lock:
+            self.pending_params.clear()
+            for name, value in converted.items(): setattr(self, name, value)
+
+    def update_params(self, params):
+        # 运行中改参数: 校验后排队, 由引擎线程在两步之间一次性应用; 未运行时直接生效
+        converted = self.convert_params(params)
+        with self.params_lock:
+            if not self.is_running:
+                for name, value in converted.items(): setattr(self, name, value)
+                return {}
+            # 跟排队中的值比较; 改回当前值时撤销排队, 否则旧的排队值还会生效
+            pending = self.pending_params
+            changed = {k: v for k, v in converted.items() if pending.get(k, getattr(self, k)) != v}
+            for k, v in changed.items():
+                if getattr(self, k) == v: del pending[k]
+                else: pending[k] = v
+            return {k: v for k, v in changed.items() if k in pending}
+
+    def apply_pending_params(self, run_only=False):
+        with self.params_lock:
+            if not self.pending_params: return
+            ready = {k: v for k, v in self.pending_params.items() if run_only or k not in RUN_ONLY_PARAMS}
+            for k in ready: del self.pending_params[k]
+        if not ready: return
+        old_range = (self.min_scale, self.max_scale)
+        for name, value in ready.items(): setattr(self, name, value)
+        if (self.min_scale, self.max_scale) != old_range and self.is_running:
+            self.cur_task = "热更新"
+            t0 = time.perf_counter()
+            n = self.refresh_scaled_templates()
+            self._mark("rescale", t0, {"templates": n})
+        self.tracer.instant("params", "engine", {k: str(v) for k, v in ready.items()})
+        self.log(f"参数已热更新: {', '.join(f'{k}={v}' for k, v in ready.items())}")
+
+    def get_params(self):
+        return {name: getattr(self, name) for name in ENGINE_PARAMS}
+
     def log(self, msg):
         write_log(msg)
         if self.callback_msg: self.callback_msg(msg)
@@ -157,59 +360,149 @@ class RPAEngine:
     def check_stop_flag(self):
         return self.stop_requested
 
+    def _mark(self, phase, t0, args=None):
+        # 记录一段耗时到当前步骤, 返回当前时刻方便串联下一段
+        t1 = time.perf_counter()
+        if getattr(self.quiet_marks, "on", False): return t1  # 预判线程的耗时单独记在 lookahead
+        self.metrics.record(self.cur_task, phase, t1 - t0)
+        if self.tracer.enabled:
+            if phase == "step": self.tracer.complete(self.cur_task, "step", t0, t1, args)
+            else: self.tracer.complete(phase, self.cur_task, t0, t1, args)
+        return t1
+
+    def wanted_scales(self):
+        import numpy as np
+        steps = int((self.max_scale - self.min_scale) / SCALE_STEP) + 1
+        # Avoid division by zero if steps is weird, but it should be fine.
+        # linspace handles it.
+        if steps < 1: steps = 1
+        return [float(s) for s in np.linspace(self.min_scale, self.max_scale, steps) if not 0.99 < s < 1.01]
+
+    def build_scaled_templates(self, template, reuse=()):
+        # reuse: 已有的 [(scale, 模板)], 缩放值相同的直接沿用, 只补算缺的
+        import cv2
+        have = {round(s, 4): t for s, t in reuse}
+        templates_list = []
+        for scale in self.wanted_scales():
+            tpl = have.get(round(scale, 4))
+            if tpl is None:
+                rw = int(template.shape[1] * scale)
+                rh = int(template.shape[0] * scale)
+                if rw < 1 or rh < 1: continue
+                tpl = cv2.resize(template, (rw, rh))
+            templates_list.append((scale, tpl))
+        return templates_list
+
+    def refresh_scaled_templates(self):
+        # 缩放范围变化后增量更新所有已加载模板, 返回有变化的模板数
+        if not self.opencv_available: return 0
+        n = 0
+        want = [round(s, 4) for s in self.wanted_scales()]
+        for path, gray in list(self.gray_cache.items()):
+            cur = self.scaled_templates_cache.get(path, [])
+            if [round(s, 4) for s, _ in cur] == want: continue
+            self.scaled_templates_cache[path] = self.build_scaled_templates(gray, cur) if want else []
+            n += 1
+        return n
+
+    def template_changed(self, path):
+        # 脚本包里的模板没有对应文件, 视为不变
+        try: return os.path.getmtime(path) != self.template_mtime.get(path)
+        except OSError: return path in self.template_mtime
+
+    def drop_template(self, path):
+        for cache in (self.img_cache, self.gray_cache, self.scaled_templates_cache, self.template_mtime,
+                      self.probe_cache, self.probe_weak, self.learned_scale, self.scale_misses,
+                      self.scale_candidate):
+            cache.pop(path, None)
+
+    def load_template(self, path):
+        # 读取模板并缓存原图与灰度图, 失败返回 None
+        if path in self.gray_cache: return self.gray_cache[path]
+        if not os.path.exists(path): return None
+        import numpy as np
+        from PIL import Image
+        mtime = os.path.getmtime(path)
+        img = Image.open(path)
+        img.load()
+        self.template_mtime[path] = mtime
+        self.img_cache[path] = img
+        gray = np.array(img if img.mode == 'L' else img.convert('L'))
+        self.gray_cache[path] = gray
+        return gray
+
+    def use_bundle(self, bundle):
+        # 使用脚本包里预先算好的灰度/缩放模板, None 表示取消
+        self.bundle = bundle
+        self.img_cache = {}
+        self.gray_cache = {}
+        self.scaled_templates_cache = {}
+        self.template_mtime = {}
+        self.template_bank.clear()
+        self.bank_entries = {}
+        self.probe_cache = {}
+        self.probe_weak = {}
+
     def load_and_precompute(self, tasks):
-        if not self.opencv_available: return
+        if not self.check_engine_status(): return
         try:
-            import cv2
-            import numpy as np
-            
             write_log("正在预加载资源...")
+            bundle = self.bundle
+            bundle_scaled_ok = bundle is not None and (bundle.min_scale, bundle.max_scale) == (self.min_scale, self.max_scale)
+            want = [round(s, 4) for s in self.wanted_scales()]
             for task in tasks:
-                path = str(task.get("value", ""))
-                if not path or not os.path.exists(path): continue
                 # Types that involve images: 1.0 (click), 2.0 (double click), 3.0 (right click), 8.0 (hover)
-                # But actually find_target handles finding the image.
-                if task.get("type") not in [1.0, 2.0, 3.0, 8.0]: continue
+                if task.get("type") not in IMAGE_TASK_TYPES: continue
+                path = str(task.get("value", ""))
+                if not path: continue
+                if path in self.template_mtime and self.template_changed(path): self.drop_template(path)
+                if "scale" in task and path not in self.learned_scale:
+                    try: self.learned_scale[path] = float(task["scale"])  # 脚本里保存的校准结果
+                    except (TypeError, ValueError): pass
                 
-                img = Image.open(path)
-                img.load()
-                self.img_cache[path] = img
+                if bundle is not None and path in bundle.gray:
+                    self.gray_cache[path] = bundle.gray[path]
+                    if bundle_scaled_ok:
+                        self.scaled_templates_cache[path] = bundle.scaled.get(path, [])
+                        if self.probe_filter: self.get_probe(path)
+                        continue
                 
-                if self.min_scale != 1.0 or self.max_scale != 1.0:
-                    if img.mode != 'L': img = img.convert('L')
-                    template = np.array(img)
-                    
-                    templates_list = []
-                    steps = int((self.max_scale - self.min_scale) / 0.05) + 1
-                    # Avoid division by zero if steps is weird, but it should be fine.
-                    # linspace handles it.
-                    if steps < 1: steps = 1
-                    
-                    for scale in np.linspace(self.min_scale, self.max_scale, steps):
-                        if 0.99 < scale < 1.01: continue
-                        rw = int(template.shape[1] * scale)
-                        rh = int(template.shape[0] * scale)
-                        if rw < 1 or rh < 1: continue
-                        resized_tpl = cv2.resize(template, (rw, rh))
-                        templates_list.append(resized_tpl)
-                    
-                    self.scaled_templates_cache[path] = templates_list
+                try: template = self.load_template(path)
+                except Exception as e:
+                    self.log(f"模板读取失败: {path} ({e})")
+                    continue
+                if template is None:
+                    self.log(f"模板不存在, 该步骤将找不到目标: {path}")
+                    continue
+                if self.probe_filter: self.get_probe(path)
+                cur = self.scaled_templates_cache.get(path, [])
+                if [round(s, 4) for s, _ in cur] == want: continue
+                # 上次运行留下的缓存: 只补算新增的缩放
+                self.scaled_templates_cache[path] = self.build_scaled_templates(template, cur) if want else []
             write_log("资源预加载完成。")
         except Exception as e:
             write_log(f"预计算失败: {e}")
 
     def find_target_optimized(self, img_path):
+        if self.spec_hits or self.spec_future is not None:
+            loc = self.speculative_hit(img_path)
+            if loc is not None:
+                self.last_hit[img_path] = loc
+                return loc
+        t0 = t_start = time.perf_counter()
         try:
-            screenshot_pil = pyautogui.screenshot(region=self.scan_region)
+            screenshot_pil = self.capture_backend.grab(self.scan_region)
         except: return None
+        t0 = self._mark("capture", t0, {"region": self.scan_region})
         
         offset_x = self.scan_region[0] if self.scan_region else 0
         offset_y = self.scan_region[1] if self.scan_region else 0
 
+        if self.opencv_available is None: self.check_engine_status()
         if not self.opencv_available:
             if img_path in self.img_cache:
                 try: 
-                    res = pyautogui.locate(self.img_cache[img_path], screenshot_pil, confidence=self.confidence)
+                    res = get_pyautogui().locate(self.img_cache[img_path], screenshot_pil, confidence=self.confidence)
                     if res:
                         cx = res.left + (res.width / 2) + offset_x
                         cy = res.top + (res.height / 2) + offset_y
@@ -217,7 +510,7 @@ class RPAEngine:
                 except: pass
             elif os.path.exists(img_path):
                  try:
-                    res = pyautogui.locate(img_path, screenshot_pil, confidence=self.confidence)
+                    res = get_pyautogui().locate(img_path, screenshot_pil, confidence=self.confidence)
                     if res:
                         cx = res.left + (res.width / 2) + offset_x
                         cy = res.top + (res.height / 2) + offset_y
@@ -232,56 +525,524 @@ class RPAEngine:
         screen_np = np.array(screenshot_pil)
         # Convert RGB to GRAY
         # pyautogui returns RGB usually (PIL image)
-        screen_gray = cv2.cvtColor(screen_np, cv2.COLOR_RGB2GRAY)
-        
-        if img_path not in self.img_cache:
-            if os.path.exists(img_path):
-                try:
-                    img = Image.open(img_path)
-                    img.load()
-                    self.img_cache[img_path] = img
-                except: return None
-            else:
-                return None
-        
-        pil_template = self.img_cache[img_path]
+        screen_gray = self.normalize_frame(cv2.cvtColor(screen_np, cv2.COLOR_RGB2GRAY))
+        thumb = frame_thumb(screen_gray)
+        self.frame_changed = thumb_changed(self.last_thumb, thumb)
+        self.last_thumb = thumb
+        self.last_frame = (screen_gray, offset_x, offset_y, self.frame_factor)
+        t0 = self._mark("gray", t0)
+        loc = self.locate(screen_gray, img_path, offset_x, offset_y)
+        if loc is not None: self.last_hit[img_path] = loc
+        if self.flight is not None: self.flight_add(screen_gray, offset_x, offset_y, t_start, {img_path: loc})
+        return loc
+
+    def locate(self, screen_gray, img_path, offset_x, offset_y):
+        # 在已截好的画面上找一个模板 (像素探针 -> 完整匹配), 返回屏幕坐标
+        skip_exact = self.exact_unlikely(img_path)
+        if self.probe_filter and not skip_exact:
+            loc = self.probe_stage(screen_gray, img_path, offset_x, offset_y)
+            if loc is not None:
+                self.learn_scale(img_path, 1.0)
+                return loc
+        loc = self.match_template(screen_gray, img_path, skip_exact=skip_exact)
+        return None if loc is None else self.to_screen(loc, offset_x, offset_y)
+
+    def flight_add(self, screen_gray, offset_x, offset_y, t_start, found):
+        self.flight.add(screen_gray, {
+            "results": [{"template": p, "loc": list(loc) if loc else None} for p, loc in found.items()],
+            "timings": {"time": time.time(), "step": self.cur_step + 1, "task": self.cur_task,
+                        "total_ms": round((time.perf_counter() - t_start) * 1000, 2),
+                        "offset": [offset_x, offset_y], "factor": self.frame_factor},
+        })
+
+    def flight_dump(self, kind, reason):
+        # kind: timeout / watchdog / error, 用作目录名后缀
+        rec = self.flight
+        if rec is None: return None
+        now = time.time()
+        if kind == "timeout" and now - self.flight_last.get(kind, 0.0) < FLIGHT_MIN_INTERVAL: return None
+        if not len(rec) and not rec.pending: return None
+        self.flight_last[kind] = now
+        out = os.path.join(self.flight_dir or get_output_path("rpa_flight"), time.strftime("%Y%m%d_%H%M%S_") + kind)
+        templates = sorted({str(t.get("value", "")) for t in self.cur_tasks or () if t.get("type") in IMAGE_TASK_TYPES})
+        rec.dump_async(out, reason, templates, {"task": self.cur_task, "stats": dict(self.stats), "params": self.get_params()},
+                       on_done=lambda n: self.log(f"飞行记录已写出: {out} ({n} 帧, {reason})"))
+        return out
+
+    def downscale_factor(self):
+        f = self.match_downscale
+        if f <= 0:
+            if self.dpi_scale is None:
+                self.dpi_scale = detect_dpi_scale()
+                write_log(f"系统缩放: {self.dpi_scale:.2f}")
+            f = self.dpi_scale
+        return max(f, 1.0)
+
+    def normalize_frame(self, screen_gray):
+        # 高分屏截图先整体缩小一次, 在模板截取时的分辨率上匹配
+        import cv2
+        f = self.downscale_factor()
+        self.frame_factor = f
+        if f == 1.0: return screen_gray
+        t0 = time.perf_counter()
+        h, w = screen_gray.shape[:2]
+        small = cv2.resize(screen_gray, (max(int(w / f), 1), max(int(h / f), 1)), interpolation=cv2.INTER_AREA)
+        self._mark("downscale", t0, {"factor": round(f, 3)})
+        return small
+
+    def to_screen(self, loc, offset_x, offset_y):
+        # 匹配坐标 (缩小后的画面) -> 物理屏幕坐标
+        f = self.frame_factor
+        if f == 1.0: return (loc[0] + offset_x, loc[1] + offset_y)
+        return (int(round(loc[0] * f)) + offset_x, int(round(loc[1] * f)) + offset_y)
+
+    def _count(self, key):
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+    def get_probe(self, img_path):
+        probe = self.probe_cache.get(img_path)
+        if probe is None:
+            gray = self.gray_cache.get(img_path)
+            if gray is None: return None
+            probe = self.probe_cache[img_path] = make_probe(gray)
+        return probe
+
+    def verify_at(self, screen_gray, tpl_gray, x, y, margin=2):
+        # 在 (x, y) 附近的小块上做原尺寸匹配, 返回 (得分, 中心点)
+        import cv2
+        h, w = tpl_gray.shape[:2]
+        x0, y0 = max(x - margin, 0), max(y - margin, 0)
+        roi = screen_gray[y0:y + h + margin, x0:x + w + margin]
+        if roi.shape[0] < h or roi.shape[1] < w: return 0.0, None
+        _, max_v, _, max_l = cv2.minMaxLoc(cv2.matchTemplate(roi, tpl_gray, cv2.TM_CCOEFF_NORMED))
+        return max_v, (x0 + max_l[0] + w // 2, y0 + max_l[1] + h // 2)
+
+    def probe_stage(self, screen_gray, img_path, offset_x, offset_y):
+        # 返回确认命中的屏幕坐标, 否则 None (交给完整匹配)
+        # 探针比的是原始灰度, 亮度/对比度变了 (悬停高亮等) 就对不上, 所以只用来提前确认命中,
+        # 不能据此判定目标不在
+        probe = self.get_probe(img_path)
+        if probe is None: return None
+        tpl_gray = self.gray_cache[img_path]
+        h, w = probe.shape
+        t0 = time.perf_counter()
+        last = self.last_hit.get(img_path)
+        if last is not None:
+            f = self.frame_factor
+            x, y = int((last[0] - offset_x) / f) - w // 2, int((last[1] - offset_y) / f) - h // 2
+            if probe_at(screen_gray, probe, x, y):
+                score, c = self.verify_at(screen_gray, tpl_gray, x, y)
+                if score >= self.confidence:
+                    self._count("probe_fast")
+                    self._mark("probe", t0, {"result": "fast", "score": round(score, 4)})
+                    return self.to_screen(c, offset_x, offset_y)
+        if self.probe_weak.get(img_path, 0) >= 3:
+            self._count("probe_pass")
+            return None
+        cands = probe_grid(screen_gray, probe)
+        if cands is None or len(cands) > 32:
+            # 探针区分度不够 (纹理相近的背景等), 交给完整匹配
+            self.probe_weak[img_path] = self.probe_weak.get(img_path, 0) + 1
+            self._count("probe_pass")
+            self._mark("probe", t0, {"result": "pass", "candidates": -1 if cands is None else len(cands)})
+            return None
+        self.probe_weak[img_path] = 0
+        best, best_c = 0.0, None
+        for x, y in cands:
+            score, c = self.verify_at(screen_gray, tpl_gray, int(x), int(y))
+            if score > best: best, best_c = score, c
+        if best >= self.confidence:
+            self._count("probe_fast")
+            self._mark("probe", t0, {"result": "grid", "candidates": len(cands), "score": round(best, 4)})
+            return self.to_screen(best_c, offset_x, offset_y)
+        self._count("probe_pass")
+        self._mark("probe", t0, {"result": "miss", "candidates": len(cands)})
+        return None
+
+    def scale_plan(self, img_path, scaled):
+        # 返回 (本次要扫的 [(scale, 模板)], 是否为校准后的窄范围)
+        # 校准后只扫学到的缩放 ±1 步; 连续未找到 scale_recal 次后完整扫一遍重新校准
+        if not self.scale_calibration: return scaled, False
+        learned = self.learned_scale.get(img_path)
+        if learned is not None and self.scale_misses.get(img_path, 0) < self.scale_recal:
+            near = [e for e in scaled if abs(e[0] - learned) <= SCALE_STEP + 1e-6]
+            if near or abs(learned - 1.0) <= SCALE_STEP + 1e-6:
+                return sorted(near, key=lambda e: abs(e[0] - learned)), True
+        ref = learned if learned is not None else self.session_scale
+        if ref is not None: scaled = sorted(scaled, key=lambda e: abs(e[0] - ref))
+        return scaled, False
+
+    def exact_unlikely(self, img_path):
+        # 已校准到明显不是原尺寸时, 原尺寸匹配与像素探针都可以省掉
+        if not self.scale_calibration or self.scale_misses.get(img_path, 0) >= self.scale_recal: return False
+        learned = self.learned_scale.get(img_path)
+        return learned is not None and abs(learned - 1.0) > SCALE_STEP + 1e-6 and \
+            any(abs(s - learned) <= SCALE_STEP + 1e-6 for s, _ in self.scaled_templates_cache.get(img_path, ()))
+
+    def learn_scale(self, img_path, scale):
+        self.scale_misses[img_path] = 0
+        if not self.scale_calibration: return
+        self.session_scale = scale
+        old = self.learned_scale.get(img_path)
+        if old is not None and abs(old - scale) <= SCALE_STEP + 1e-6: return
+        # 连续命中同一缩放才确认; 缩放本身在变的目标一直用完整扫描
+        cand, n = self.scale_candidate.get(img_path, (None, 0))
+        n = n + 1 if cand is not None and abs(cand - scale) <= 1e-6 else 1
+        self.scale_candidate[img_path] = (scale, n)
+        if old is not None: del self.learned_scale[img_path]
+        if n >= CALIBRATE_HITS:
+            self.learned_scale[img_path] = scale
+            self.log(f"缩放校准: {os.path.basename(img_path)} = {scale:.2f}" + (f" (原 {old:.2f})" if old is not None else ""))
+
+    def note_scale_miss(self, img_path, narrowed):
+        # 窄范围没找到记一次; 完整扫描也没找到说明目标不在画面里, 校准结果不变
+        self.scale_misses[img_path] = self.scale_misses.get(img_path, 0) + 1 if narrowed else 0
+
+    def store_scales(self, tasks):
+        # 把校准结果写回找图指令的 scale 字段, 随脚本保存
+        n = 0
+        for task in tasks:
+            if not isinstance(task, dict) or task.get("type") not in IMAGE_TASK_TYPES: continue
+            scale = self.learned_scale.get(str(task.get("value", "")))
+            if scale is not None and task.get("scale") != round(scale, 4):
+                task["scale"] = round(scale, 4)
+                n += 1
+        return n
+
+    def get_match_pool(self):
+        # 缩放扫描/多模板查找用的线程池, matchTemplate 会释放 GIL
+        import concurrent.futures
+        n = max(int(self.match_threads), 1)
+        if n == 1: return None
+        if self.match_pool is None or self.match_pool_size != n:
+            if self.match_pool is not None: self.match_pool.shutdown(wait=False)
+            self.match_pool = concurrent.futures.ThreadPoolExecutor(n, thread_name_prefix="match")
+            self.match_pool_size = n
+        return self.match_pool
+
+    def match_template(self, screen_gray, img_path, cancel=None, parallel=True, skip_exact=False, record=True):
+        # 在灰度画面上找一个模板 (原尺寸 + 缩放), 返回相对画面的中心点
+        # skip_exact: 缩放校准认为不是原尺寸, 直接扫缩放
+        # record: 是否计入缩放校准 (预判查找不计, 目标可能要点击之后才出现)
+        import cv2
+        tpl_gray = self.gray_cache.get(img_path)
+        if tpl_gray is None:
+            try: tpl_gray = self.load_template(img_path)
+            except: return None
+            if tpl_gray is None: return None
         
         try:
-            if pil_template.mode != 'L': pil_template = pil_template.convert('L')
-            tpl_gray = np.array(pil_template)
-            
-            if tpl_gray.shape[0] > screen_gray.shape[0] or tpl_gray.shape[1] > screen_gray.shape[1]:
+            if skip_exact or self.exact_unlikely(img_path) or \
+                    tpl_gray.shape[0] > screen_gray.shape[0] or tpl_gray.shape[1] > screen_gray.shape[1]:
                 pass 
             else:
+                t0 = time.perf_counter()
                 res = cv2.matchTemplate(screen_gray, tpl_gray, cv2.TM_CCOEFF_NORMED)
                 min_v, max_v, min_l, max_l = cv2.minMaxLoc(res)
+                self._mark("match", t0, {"score": round(max_v, 4)})
                 if max_v >= self.confidence:
+                    if record: self.learn_scale(img_path, 1.0)
                     h, w = tpl_gray.shape[:2]
-                    final_x = max_l[0] + w//2 + offset_x
-                    final_y = max_l[1] + h//2 + offset_y
-                    return (final_x, final_y)
+                    return (max_l[0] + w//2, max_l[1] + h//2)
         except: pass
         
         # Checked cached scaled templates
-        if img_path in self.scaled_templates_cache:
-            for resized_tpl in self.scaled_templates_cache[img_path]:
-                if self.check_stop_flag(): return None
-                try:
-                    if resized_tpl.shape[0] > screen_gray.shape[0] or resized_tpl.shape[1] > screen_gray.shape[1]:
-                        continue
-                    res = cv2.matchTemplate(screen_gray, resized_tpl, cv2.TM_CCOEFF_NORMED)
-                    min_v, max_v, min_l, max_l = cv2.minMaxLoc(res)
-                    if max_v >= self.confidence:
-                        h, w = resized_tpl.shape[:2]
-                        final_x = max_l[0] + w//2 + offset_x
-                        final_y = max_l[1] + h//2 + offset_y
-                        return (final_x, final_y)
-                except: continue
+        scaled = self.scaled_templates_cache.get(img_path)
+        if not scaled: return None
+        scaled, narrowed = self.scale_plan(img_path, scaled)
+        if cancel is None: cancel = threading.Event()
+        pool = self.get_match_pool() if parallel and len(scaled) > 1 else None
+        if pool is None:
+            for scale, resized_tpl in scaled:
+                hit = self.match_scale(screen_gray, scale, resized_tpl, cancel)
+                if hit:
+                    if record: self.learn_scale(img_path, scale)
+                    return hit
+            if record and not cancel.is_set(): self.note_scale_miss(img_path, narrowed)
+            return None
         
+        # 各缩放并行匹配, 任一命中后其余的在开始前放弃
+        import concurrent.futures
+        futures = {pool.submit(self.match_scale, screen_gray, scale, tpl, cancel): scale for scale, tpl in scaled}
+        try:
+            for fut in concurrent.futures.as_completed(futures):
+                hit = fut.result()
+                if hit:
+                    if record: self.learn_scale(img_path, futures[fut])
+                    return hit
+            if record and not cancel.is_set(): self.note_scale_miss(img_path, narrowed)
+        finally:
+            cancel.set()
+            for fut in futures: fut.cancel()
         return None
 
-    def mouseClick(self, clickTimes, lOrR, img_path, reTry):
+    def match_scale(self, screen_gray, scale, resized_tpl, cancel):
+        import cv2
+        if cancel.is_set() or self.check_stop_flag(): return None
+        try:
+            if resized_tpl.shape[0] > screen_gray.shape[0] or resized_tpl.shape[1] > screen_gray.shape[1]:
+                return None
+            t0 = time.perf_counter()
+            res = cv2.matchTemplate(screen_gray, resized_tpl, cv2.TM_CCOEFF_NORMED)
+            min_v, max_v, min_l, max_l = cv2.minMaxLoc(res)
+            self._mark("scale", t0, {"scale": round(scale, 3), "score": round(max_v, 4)})
+            if max_v >= self.confidence:
+                cancel.set()
+                h, w = resized_tpl.shape[:2]
+                return (max_l[0] + w//2, max_l[1] + h//2)
+        except: pass
+        return None
+
+    def sync_bank(self, paths):
+        # 模板库跟随灰度/缩放缓存; 缩放范围变化或模板重载后整条替换
+        for path in paths:
+            gray = self.gray_cache.get(path)
+            if gray is None:
+                try: gray = self.load_template(path)
+                except: gray = None
+            entries = [(1.0, gray)] + list(self.scaled_templates_cache.get(path, [])) if gray is not None else []
+            have = self.bank_entries.get(path)
+            if have is not None and len(have) == len(entries) and all(a is b for (_, a), (_, b) in zip(have, entries)):
+                continue
+            for scale, _ in have or []: self.template_bank.discard((path, scale))
+            for scale, tpl in entries: self.template_bank.add((path, scale), tpl)
+            self.bank_entries[path] = entries
+
+    def find_all(self, img_paths):
+        # 一次截图找多个模板, 返回 {路径: 坐标或 None}
+        # 同尺寸模板共享窗口统计, 先全部按原尺寸找, 没找到的再扫缩放
+        if self.opencv_available is None: self.check_engine_status()
+        if not self.opencv_available: return {p: self.find_target_optimized(p) for p in img_paths}
+        import cv2
+        import numpy as np
+        t0 = t_start = time.perf_counter()
+        try: screenshot_pil = self.capture_backend.grab(self.scan_region)
+        except: return {p: None for p in img_paths}
+        t0 = self._mark("capture", t0, {"region": self.scan_region})
+        screen_gray = self.normalize_frame(cv2.cvtColor(np.array(screenshot_pil), cv2.COLOR_RGB2GRAY))
+        t0 = self._mark("gray", t0)
+        offset_x = self.scan_region[0] if self.scan_region else 0
+        offset_y = self.scan_region[1] if self.scan_region else 0
+
+        self.sync_bank(img_paths)
+        found = {}  # 路径 -> (得分, 坐标, 缩放)
+        plans = {p: self.scale_plan(p, self.bank_entries.get(p, [])[1:]) for p in img_paths}
+        # 第一轮: 原尺寸 (已校准到其他缩放的模板直接用校准范围); 第二轮: 其余模板的缩放
+        keys = []
+        for p in img_paths:
+            keys += [(p, s) for s, _ in plans[p][0]] if self.exact_unlikely(p) else [(p, 1.0)]
+        for rnd in (1, 2):
+            if not keys: break
+            for (path, scale), (score, (x, y)) in self.template_bank.match(screen_gray, keys).items():
+                if score >= self.confidence and score > found.get(path, (0.0,))[0]:
+                    found[path] = (score, self.to_screen((x, y), offset_x, offset_y), scale)
+            t0 = self._mark("bank", t0, {"templates": len(keys), "hits": len(found)})
+            keys = [(p, s) for p in img_paths if p not in found and not self.exact_unlikely(p) for s, _ in plans[p][0]]
+        for p in img_paths:
+            if p in found: self.learn_scale(p, found[p][2])
+            elif self.bank_entries.get(p): self.note_scale_miss(p, plans[p][1])
+        result = {p: found[p][1] if p in found else None for p in img_paths}
+        if self.flight is not None: self.flight_add(screen_gray, offset_x, offset_y, t_start, result)
+        return result
+
+    def find_any(self, img_paths):
+        # 一次截图里找多个模板, 返回最先找到的 (路径, 坐标), 都没有则 (None, None)
+        if len(img_paths) == 1: return img_paths[0], self.find_target_optimized(img_paths[0])
+        if self.opencv_available is None: self.check_engine_status()
+        pool = self.get_match_pool() if self.opencv_available else None
+        if pool is None:
+            for p in img_paths:
+                loc = self.find_target_optimized(p)
+                if loc: return p, loc
+            return None, None
+        import cv2
+        import numpy as np
+        t0 = t_start = time.perf_counter()
+        try: screenshot_pil = self.capture_backend.grab(self.scan_region)
+        except: return None, None
+        t0 = self._mark("capture", t0, {"region": self.scan_region})
+        screen_gray = self.normalize_frame(cv2.cvtColor(np.array(screenshot_pil), cv2.COLOR_RGB2GRAY))
+        self._mark("gray", t0)
+        offset_x = self.scan_region[0] if self.scan_region else 0
+        offset_y = self.scan_region[1] if self.scan_region else 0
+
+        import concurrent.futures
+        cancel = threading.Event()
+        def job(path):
+            # 池内不再嵌套并行, 避免工作线程互相等待
+            if cancel.is_set(): return None
+            loc = self.match_template(screen_gray, path, cancel, parallel=False)
+            if loc: cancel.set()
+            return loc
+        futures = {pool.submit(job, p): p for p in img_paths}
+        hit_path, hit = None, None
+        try:
+            for fut in concurrent.futures.as_completed(futures):
+                loc = fut.result()
+                if loc:
+                    hit_path, hit = futures[fut], self.to_screen(loc, offset_x, offset_y)
+                    break
+        finally:
+            cancel.set()
+            for fut in futures: fut.cancel()
+        if self.flight is not None:
+            self.flight_add(screen_gray, offset_x, offset_y, t_start, {p: hit if p == hit_path else None for p in img_paths})
+        return hit_path, hit
+
+    def settle_region(self, center):
+        if center is None: return self.scan_region
+        bw, bh = SETTLE_BOX
+        return (max(int(center[0]) - bw // 2, 0), max(int(center[1]) - bh // 2, 0), bw, bh)
+
+    def settle_baseline(self, max_wait, center=None):
+        # 点击/粘贴之前先截一张观察区域; 按下期间界面就有反应时, 这张才是"变化前"
+        if max_wait <= 0 or not self.adaptive_settle or self.opencv_available is not True: return None
+        return self.settle_thumb(self.settle_region(center))
+
+    def settle(self, max_wait, center=None, baseline=None):
+        # 固定模式直接睡 max_wait; 自适应模式观察 center 附近 (默认识别区域/全屏),
+        # 画面先变化再稳定 settle_stable 秒即返回, 始终没有变化则等满 max_wait
+        # baseline: 动作之前截的 settle_baseline, 没有时以进入这里时的画面为准
+        if max_wait <= 0: return
+        t0 = time.perf_counter()
+        if not self.adaptive_settle or self.opencv_available is not True:
+            time.sleep(max_wait)
+            self._mark("settle", t0)
+            return
+        region = self.settle_region(center)
+        deadline = t0 + max_wait
+        prev = baseline if baseline is not None else self.settle_thumb(region)
+        changed_at = None
+        reacted = False
+        while True:
+            now = time.perf_counter()
+            if now >= deadline or self.check_stop_flag(): break
+            time.sleep(min(SETTLE_POLL, deadline - now))
+            cur = self.settle_thumb(region)
+            now = time.perf_counter()
+            if thumb_changed(prev, cur, SETTLE_THRESHOLD):
+                reacted, changed_at = True, now
+            elif reacted and now - changed_at >= self.settle_stable:
+                break
+            prev = cur
+        self._mark("settle", t0, {"adaptive": True, "reacted": reacted, "cap": max_wait})
+        if reacted and time.perf_counter() < deadline: self._count("settle_early")
+
+    def settle_thumb(self, region):
+        import cv2
+        import numpy as np
+        try: img = self.capture_backend.grab(region)
+        except: return None
+        gray = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2GRAY)
+        # 小区域采样密一些, 整屏按默认间隔
+        return frame_thumb(gray, 2 if region and region[2] * region[3] <= SETTLE_BOX[0] * SETTLE_BOX[1] else 8)
+
+    def get_image_writer(self):
+        if self.image_writer is None or self.image_writer.queue.maxsize != max(self.shot_queue, 1):
+            if self.image_writer is not None: self.image_writer.close()
+            self.image_writer = ImageWriter(max_queue=max(self.shot_queue, 1))
+        return self.image_writer
+
+    def screenshot(self, path):
+        # 只在这里截帧, 编码写盘交给后台; 队列满时等待, 等待时间记为 shot_wait
+        fmt_name = self.shot_format.lower() if self.shot_format.lower() in FORMATS else "png"
+        if os.path.isdir(path):
+            ms = int(time.time() * 1000) % 1000
+            path = os.path.join(path, time.strftime("ss_%H%M%S") + f"_{ms:03d}.{fmt_name}")
+        t0 = time.perf_counter()
+        try: img = self.capture_backend.grab(self.scan_region)
+        except Exception as e:
+            self.log(f"截图失败: {e}")
+            return
+        t0 = self._mark("capture", t0, {"region": self.scan_region})
+        fmt = format_for(path, fmt_name)
+        writer = self.get_image_writer()
+        waited = writer.submit(img, path, fmt, save_options(fmt, self.shot_quality, self.shot_compress), self.check_stop_flag)
+        self.stats["shot_wait"] += waited
+        self._mark("shot", t0, {"path": path, "queued": writer.pending(), "wait": round(waited, 4)})
+
+    def start_lookahead(self):
+        # 当前步骤命中后, 趁按住/结算的空档在刚才那一帧上找后面 N 步的图
+        if self.lookahead <= 0 or not self.cur_tasks or self.last_frame is None: return
+        paths = []
+        for task in self.cur_tasks[self.cur_step + 1:]:
+            if task.get("type") not in IMAGE_TASK_TYPES: continue
+            p = str(task.get("value", ""))
+            if p and p not in paths: paths.append(p)
+            if len(paths) >= self.lookahead: break
+        if not paths: return
+        if self.spec_cancel is not None: self.spec_cancel.set()
+        cancel = self.spec_cancel = threading.Event()
+        hits = self.spec_hits = {}
+        if self.spec_pool is None:
+            import concurrent.futures
+            self.spec_pool = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="lookahead")
+        self.spec_future = self.spec_pool.submit(self.speculate, self.last_frame, paths, hits, cancel, self.cur_task)
+
+    def speculate(self, frame, paths, hits, cancel, task_name):
+        screen_gray, offset_x, offset_y, factor = frame
+        # 预判命中只在这一帧覆盖的范围内复核
+        bounds = (offset_x, offset_y, offset_x + int(screen_gray.shape[1] * factor), offset_y + int(screen_gray.shape[0] * factor))
+        self.quiet_marks.on = True
+        t0 = time.perf_counter()
+        for path in paths:
+            if cancel.is_set() or self.check_stop_flag(): break
+            try: loc = self.match_template(screen_gray, path, threading.Event(), parallel=False, record=False)
+            except: loc = None
+            if loc is None or cancel.is_set(): continue
+            if factor != 1.0: loc = (int(round(loc[0] * factor)), int(round(loc[1] * factor)))
+            hits[path] = (loc[0] + offset_x, loc[1] + offset_y, bounds)
+        self.metrics.record(task_name, "lookahead", time.perf_counter() - t0)
+        if self.tracer.enabled: self.tracer.complete("lookahead", task_name, t0, time.perf_counter(), {"paths": len(paths)})
+
+    def speculative_hit(self, img_path):
+        # 预判过的目标: 只截它附近一小块复核, 还在原处就直接用
+        fut = self.spec_future
+        entry = self.spec_hits.pop(img_path, None)
+        if entry is None:
+            # 预判还没轮到这张图就不再等它, 免得和正常找图抢 CPU
+            if fut is not None and not fut.done() and self.spec_cancel is not None: self.spec_cancel.set()
+            return None
+        tpl = self.gray_cache.get(img_path)
+        if tpl is None or self.opencv_available is not True: return None
+        import cv2
+        import numpy as np
+        t0 = time.perf_counter()
+        span = max(self.max_scale, 1.0) * self.downscale_factor()
+        half_w = int(tpl.shape[1] * span / 2) + SPEC_MARGIN
+        half_h = int(tpl.shape[0] * span / 2) + SPEC_MARGIN
+        bx0, by0, bx1, by1 = entry[2]
+        w, h = min(2 * half_w, bx1 - bx0), min(2 * half_h, by1 - by0)
+        x0 = min(max(int(entry[0]) - half_w, bx0), bx1 - w)
+        y0 = min(max(int(entry[1]) - half_h, by0), by1 - h)
+        try: roi_pil = self.capture_backend.grab((x0, y0, w, h))
+        except: return None
+        roi = self.normalize_frame(cv2.cvtColor(np.array(roi_pil), cv2.COLOR_RGB2GRAY))
+        loc = self.match_template(roi, img_path, parallel=False, record=False)
+        self._mark("lookahead_verify", t0, {"hit": loc is not None})
+        if loc is None:
+            self._count("lookahead_stale")
+            return None
+        self._count("lookahead_hits")
+        return self.to_screen(loc, x0, y0)
+
+    def mouseClick(self, clickTimes, lOrR, img_path, reTry, latency=None, cpu=None):
         start_time = time.time()
+        poller = AdaptivePoller(self.poll_latency if latency is None else float(latency),
+                                self.poll_cpu if cpu is None else float(cpu))
+        try: self._click_loop(clickTimes, lOrR, img_path, reTry, start_time, poller)
+        finally:
+            self.record_poller(poller)
+            if poller.polls > 1:
+                self.tracer.instant("poll", self.cur_task, {"polls": poller.polls, "hz": round(poller.rate(), 1)})
+
+    def record_poller(self, poller):
+        # poll_time 只算有重试的循环, 一次就命中的步骤不拉低频率
+        self.stats["polls"] += poller.polls
+        self.stats["poll_wait"] += poller.waited
+        if poller.polls: self.stats["poll_time"] += poller.elapsed()
+
+    def _click_loop(self, clickTimes, lOrR, img_path, reTry, start_time, poller):
         
         _move = self.move_duration
         _hold = self.click_hold
@@ -295,88 +1056,302 @@ class RPAEngine:
         
         while True:
             if self.check_stop_flag(): return
-            if _timeout > 0.001 and (time.time() - start_time > _timeout): return
+            if _timeout > 0.001 and (time.time() - start_time > _timeout):
+                self.stats["misses"] += 1
+                self.flight_dump("timeout", f"{self.cur_task} 超时 {_timeout}s: {img_path}")
+                return
 
+            self.frame_changed = True
+            t_find = time.perf_counter()
             location_tuple = self.find_target_optimized(img_path)
+            work = time.perf_counter() - t_find
 
             if location_tuple:
+                self.stats["hits"] += 1
+                self.start_lookahead()
                 try:
                     x, y = location_tuple
                     
-                    pyautogui.moveTo(x, y, duration=_move)
+                    base = self.settle_baseline(_settle, (x, y))
+                    t0 = time.perf_counter()
+                    inp = self.input_backend
+                    inp.moveTo(x, y, duration=_move)
                     for _ in range(clickTimes):
-                        pyautogui.mouseDown(button=lOrR)
+                        inp.mouseDown(button=lOrR)
                         time.sleep(_hold)
-                        pyautogui.mouseUp(button=lOrR)
+                        inp.mouseUp(button=lOrR)
                         if clickTimes > 1: time.sleep(0.02)
+                    t0 = self._mark("input", t0, {"x": x, "y": y, "clicks": clickTimes})
+                    self.last_click = (x, y)
                     
-                    if _settle > 0: time.sleep(_settle)
+                    if _settle > 0:
+                        self.settle(_settle, (x, y), base)
+                        t0 = time.perf_counter()
                     
                     if _dodge_en:
-                        pyautogui.moveTo(_dx1, _dy1, duration=0)
+                        inp.moveTo(_dx1, _dy1, duration=0)
                         if _dbl_dodge:
                             time.sleep(_dbl_wait) 
-                            pyautogui.moveTo(_dx2, _dy2, duration=0)
+                            inp.moveTo(_dx2, _dy2, duration=0)
+                        self._mark("dodge", t0)
                     
                 except Exception as e: self.log(f"Err: {e}")
                 
                 if reTry != -1: return
-                else:
-                    time.sleep(0.01)
-                    continue
-            
-            if _timeout <= 0.001: return 
-            time.sleep(0.001) 
+                delay = poller.next_delay(work, True, True)
+            else:
+                if _timeout <= 0.001:
+                    self.stats["misses"] += 1
+                    return
+                delay = poller.next_delay(work, self.frame_changed, False)
+                delay = min(delay, max(_timeout - (time.time() - start_time), 0.0))
+            t0 = time.perf_counter()
+            poller.wait(delay, self.check_stop_flag)
+            self._mark("poll_wait", t0)
+
+    def color_spec(self, spec):
+        parsed = self.color_specs.get(spec)
+        if parsed is None:
+            parsed = self.color_specs[spec] = parse_color_spec(spec)
+        return parsed
+
+    def check_colors(self, conds):
+        # 只截条件覆盖的小块, 返回 (是否成立, 各条件实测颜色)
+        import numpy as np
+        region = color_bbox(conds)
+        t0 = time.perf_counter()
+        img = np.asarray(self.capture_backend.grab(region).convert("RGB"))
+        t0 = self._mark("capture", t0, {"region": list(region)})
+        samples = sample_colors(img, conds, region[0], region[1])
+        self._mark("color", t0)
+        return colors_match(samples, conds), samples
 
-    def run_tasks(self, tasks, loop_forever=False, callback_msg=None):
+    def wait_colors(self, conds, latency=None, cpu=None):
+        # 等到颜色条件成立; 识别超时为 0 时一直等 (可急停)
+        poller = AdaptivePoller(self.poll_latency if latency is None else float(latency),
+                                self.poll_cpu if cpu is None else float(cpu))
+        start_time = time.time()
+        _timeout = self.timeout_val
+        last = None
+        try:
+            while True:
+                if self.check_stop_flag(): return False
+                t0 = time.perf_counter()
+                ok, samples = self.check_colors(conds)
+                work = time.perf_counter() - t0
+                if ok:
+                    self.stats["hits"] += 1
+                    return True
+                if _timeout > 0.001 and time.time() - start_time > _timeout:
+                    self.stats["misses"] += 1
+                    self.log(f"等待颜色超时, 实际: {' '.join(format_rgb(c) for c in samples)}")
+                    self.flight_dump("timeout", f"{self.cur_task} 超时 {_timeout}s")
+                    return False
+                # 小块像素有变化就按画面变化处理, 立即回到最快节奏
+                delay = poller.next_delay(work, samples != last, False)
+                last = samples
+                if _timeout > 0.001: delay = min(delay, max(_timeout - (time.time() - start_time), 0.0))
+                t0 = time.perf_counter()
+                poller.wait(delay, self.check_stop_flag)
+                self._mark("poll_wait", t0)
+        finally:
+            self.record_poller(poller)
+
+    def color_step(self, cmd, val, idx, tasks_len, budget):
+        # 返回下一步的下标
+        conds, goto, other = self.color_spec(str(val))
+        if cmd == 10.0: ok = self.wait_colors(conds, *budget)
+        else: ok, _ = self.check_colors(conds)
+        target = goto if ok else other
+        if target is None: return idx + 1
+        if target > tasks_len: raise ValueError(f"第 {idx + 1} 步跳转目标超出范围: {target}")
+        self.stats["jumps"] += 1
+        self.tracer.instant("jump", self.cur_task, {"to": target, "matched": ok})
+        return target - 1
+
+    def save_cache(self, tasks, path):
+        # 把预加载好的模板写成脚本包, 续跑时 mmap 读回, 不再重新解码缩放
+        try:
+            n = write_bundle(path, tasks, self.get_params(), self.min_scale, self.max_scale,
+                             dict(self.gray_cache), dict(self.scaled_templates_cache))
+            write_log(f"模板缓存已写入: {path} ({n} 个)")
+        except Exception as e: write_log(f"模板缓存写入失败: {e}")
+
+    def write_checkpoint(self, digest, step, loops, tasks_len):
+        if step >= tasks_len: step, loops = 0, loops + 1
+        try:
+            # 缓存路径记成相对断点文件的, 换个工作目录续跑也能找到
+            save_checkpoint(self.checkpoint_path, {"digest": digest, "step": step, "loop": loops,
+                                                   "cache": os.path.basename(cache_path_for(self.checkpoint_path))})
+        except Exception as e: write_log(f"断点保存失败: {e}")
+
+    def restore_checkpoint(self, tasks, digest):
+        # 返回 (起始步骤, 已完成循环数), 断点与脚本不符时从头开始
+        ckpt = load_checkpoint(self.checkpoint_path)
+        if not ckpt or ckpt.get("digest") != digest or not 0 <= ckpt.get("step", -1) < len(tasks):
+            self.log("没有与当前脚本匹配的断点, 从头开始")
+            return 0, 0
+        cache = ckpt.get("cache")
+        if cache: cache = os.path.join(os.path.dirname(os.path.abspath(self.checkpoint_path)), cache)
+        if self.bundle is None and cache and os.path.exists(cache):
+            try:
+                self.use_bundle(load_bundle(cache))
+            except Exception as e: write_log(f"模板缓存读取失败: {e}")
+        self.log(f"从断点继续: 第 {ckpt['step'] + 1} 步, 已完成 {ckpt['loop']} 轮 ({ckpt.get('saved_at', '')})")
+        return ckpt["step"], ckpt["loop"]
+
+    def run_tasks(self, tasks, loop_forever=False, callback_msg=None, resume=False):
         self.is_running = True
         self.stop_requested = False
         self.callback_msg = callback_msg
+        self.apply_pending_params(run_only=True)
+        self.cur_tasks = tasks
+        self.spec_hits = {}
+        self.stop_reason = None
+        if self.flight is not None and self.flight.capacity != max(self.flight_frames, 0):
+            self.flight.close()
+            self.flight = None
+        if self.flight_frames > 0:
+            if self.flight is None: self.flight = FlightRecorder(self.flight_frames)
+            else: self.flight.clear()
         
-        self.img_cache = {}
-        self.scaled_templates_cache = {}
+        # 模板缓存跨运行保留, 预加载时按文件修改时间失效
+        self.metrics.reset()
+        self.stats = {"steps": 0, "loops": 0, "hits": 0, "misses": 0, "polls": 0, "poll_wait": 0.0, "poll_time": 0.0,
+                      "probe_fast": 0, "probe_pass": 0, "jumps": 0,
+                      "lookahead_hits": 0, "lookahead_stale": 0, "settle_early": 0, "shot_wait": 0.0, "stopped": False, "error": None, "elapsed": 0.0}
+        run_t0 = time.perf_counter()
+        if self.enable_trace: self.tracer.start()
+
+        digest = script_digest(tasks) if self.checkpoint_path else None
+        first = 0
+        prev_bundle = self.bundle
+        if digest and resume:
+            first, self.stats["loops"] = self.restore_checkpoint(tasks, digest)
+        self.cur_step = first
+        finished = False
+
+        self.cur_task = "预加载"
+        t0 = time.perf_counter()
         self.load_and_precompute(tasks)
+        self._mark("precompute", t0)
+        if digest and self.bundle is prev_bundle:
+            # 后台写模板缓存, 不耽误第一步
+            threading.Thread(target=self.save_cache, args=(tasks, cache_path_for(self.checkpoint_path)),
+                             name="cache-writer", daemon=True).start()
         
         if self.scan_region:
             write_log(f"区域模式: {self.scan_region}")
         
         try:
+            last_ckpt = time.time()
             while True:
-                for idx, task in enumerate(tasks):
+                idx = first
+                while idx < len(tasks):
+                    task = tasks[idx]
+                    self.cur_step = idx
                     if self.check_stop_flag():
+                        self.tracer.instant("stop", "engine")
                         if callback_msg: callback_msg("任务由看门狗终止")
-                        return
+                        return self.stats
+                    if self.pending_params: self.apply_pending_params()
 
                     cmd = task.get("type")
                     val = task.get("value")
                     retry = task.get("retry", 1)
+                    self.cur_task = f"#{idx + 1} {TASK_TYPES.get(cmd, cmd)}"
+                    step_t0 = time.perf_counter()
                     
-                    if cmd == 1.0: self.mouseClick(1, "left", val, retry)
-                    elif cmd == 2.0: self.mouseClick(2, "left", val, retry)
-                    elif cmd == 3.0: self.mouseClick(1, "right", val, retry)
+                    budget = (task.get("latency"), task.get("cpu"))
+                    nxt = idx + 1
+                    if cmd == 1.0: self.mouseClick(1, "left", val, retry, *budget)
+                    elif cmd == 2.0: self.mouseClick(2, "left", val, retry, *budget)
+                    elif cmd == 3.0: self.mouseClick(1, "right", val, retry, *budget)
                     elif cmd == 8.0:
                         loc = self.find_target_optimized(val)
-                        if loc: pyautogui.moveTo(loc[0], loc[1], duration=self.move_duration)
+                        self.stats["hits" if loc else "misses"] += 1
+                        if loc:
+                            self.start_lookahead()
+                            t0 = time.perf_counter()
+                            self.input_backend.moveTo(loc[0], loc[1], duration=self.move_duration)
+                            self._mark("input", t0)
                     elif cmd == 4.0: 
-                        pyperclip.copy(str(val)); pyautogui.hotkey('ctrl', 'v'); time.sleep(0.2)
+                        base = self.settle_baseline(0.2, self.last_click)
+                        t0 = time.perf_counter()
+                        self.input_backend.paste(str(val))
+                        self._mark("input", t0)
+                        self.settle(0.2, self.last_click, base)
                     elif cmd == 5.0: 
                         t_end = time.time() + float(val)
                         while time.time() < t_end:
-                            if self.check_stop_flag(): return
+                            if self.check_stop_flag(): return self.stats
                             time.sleep(0.05)
-                    elif cmd == 6.0: pyautogui.scroll(int(val))
-                    elif cmd == 7.0: pyautogui.hotkey(*[k.strip() for k in str(val).lower().split('+')])
+                    elif cmd == 6.0:
+                        t0 = time.perf_counter()
+                        self.input_backend.scroll(int(val))
+                        self._mark("input", t0)
+                    elif cmd == 7.0:
+                        t0 = time.perf_counter()
+                        self.input_backend.hotkey(*[k.strip() for k in str(val).lower().split('+')])
+                        self._mark("input", t0)
                     elif cmd == 9.0:
-                        path = str(val)
-                        if os.path.isdir(path): path = os.path.join(path, time.strftime("ss_%H%M%S.png"))
-                        try: pyautogui.screenshot(path, region=self.scan_region)
-                        except: pass
+                        self.screenshot(str(val))
+                    elif cmd in (10.0, 11.0):
+                        nxt = self.color_step(cmd, val, idx, len(tasks), budget)
+                    
+                    self._mark("step", step_t0, {"index": idx, "type": cmd})
+                    self.stats["steps"] += 1
+                    self.cur_step = nxt
+                    if digest and time.time() - last_ckpt >= self.checkpoint_interval:
+                        self.write_checkpoint(digest, nxt, self.stats["loops"], len(tasks))
+                        last_ckpt = time.time()
+                    idx = nxt
 
-                if not loop_forever: break
-                if self.check_stop_flag(): return
+                first = 0
+                self.stats["loops"] += 1
+                if not loop_forever:
+                    finished = True
+                    break
+                if self.check_stop_flag(): return self.stats
                 
         except Exception as e:
+            self.tracer.instant("exception", "engine", {"error": str(e)})
+            self.stats["error"] = str(e)
             self.log(f"引擎异常: {e}")
+            self.flight_dump("error", f"{self.cur_task} 引擎异常: {e}")
         finally:
             self.is_running = False
+            self.stats["stopped"] = self.stop_requested
+            if self.stop_reason: self.flight_dump("watchdog", self.stop_reason)
+            if self.flight is not None and self.flight.writers:
+                t0 = time.perf_counter()
+                if not self.flight.wait(): write_log("飞行记录写盘超时")
+                self._mark("flight_flush", t0)
+            if digest:
+                # 正常跑完清掉断点; 被停止/异常时记下当前步骤, 下次从这一步重来
+                if finished: clear_checkpoint(self.checkpoint_path)
+                else: self.write_checkpoint(digest, self.cur_step, self.stats["loops"], len(tasks))
+            if self.bundle is not prev_bundle: self.use_bundle(prev_bundle)
+            self.store_scales(tasks)
+            if self.image_writer is not None and self.image_writer.pending():
+                # 结束前把排队的截图写完
+                t0 = time.perf_counter()
+                if not self.image_writer.flush(): write_log(f"截图写盘超时, 还有 {self.image_writer.pending()} 张未完成")
+                self._mark("shot_flush", t0)
+            self.stats["elapsed"] = time.perf_counter() - run_t0
+            if GLOBAL_CONFIG["metrics_to_file"]:
+                try:
+                    path = get_output_path(time.strftime("rpa_metrics_%Y%m%d_%H%M%S.json"))
+                    self.metrics.export(path)
+                    write_log(f"耗时统计已导出: {path}")
+                except Exception as e: write_log(f"耗时统计导出失败: {e}")
+            if self.tracer.enabled:
+                self.tracer.stop()
+                try:
+                    path = self.trace_path or get_output_path(time.strftime("rpa_trace_%Y%m%d_%H%M%S.json"))
+                    self.tracer.write(path)
+                    write_log(f"追踪文件已写入: {path}")
+                    if callback_msg: callback_msg(f"追踪文件: {path}")
+                except Exception as e: write_log(f"追踪文件写入失败: {e}")
             if callback_msg: callback_msg("结束")
+        return self.stats
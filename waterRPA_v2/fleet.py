@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+import collections
+
+from .control import ControlClient, ControlError
+from .metrics import MetricsRecorder
+
+# ---------------------------------------------------------
+# 多进程调度器: 管理一组 run_cli.py --serve 运行器, 分配脚本, 崩溃自动重启, 汇总吞吐和耗时
+#   python -m waterRPA_v2.fleet a.json b.json c.json --local 4
+#   python -m waterRPA_v2.fleet a.json --local 8 --backend stub --duration 30 --out fleet.json
+#   python -m waterRPA_v2.fleet a.json --remote http://127.0.0.1:9001   (远程机器经 SSH 端口转发)
+# 脚本是一个队列: 单次模式下运行器跑完一个接着领下一个; --loop 时每个运行器固定循环一个脚本
+# 本地运行器挂掉会重启并从断点继续; 远程运行器挂掉只把它的脚本放回队列
+# ---------------------------------------------------------
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Runner:
+    def __init__(self, name, url=None, cmd=None, token=None):
+        self.name = name
+        self.url = url
+        self.cmd = cmd          # 本地运行器的启动命令, 远程为 None
+        self.token = token
+        self.proc = None
+        self.client = ControlClient(url, token) if url else None
+        self.script = None
+        self.restarts = 0
+        self.fails = 0          # 连续访问失败次数
+        self.done = 0           # 完成的脚本数
+        self.state = "idle"     # idle / running / dead
+        self.status = {}
+        self.metrics_raw = {}   # 最近一次拉到的直方图, 运行器重启后会丢失, 先累积到 history
+        self.history = MetricsRecorder()
+        self.steps_base = 0     # 重启/换脚本前累计的步数
+
+    @property
+    def local(self):
+        return self.cmd is not None
+
+    def spawn(self, timeout=30.0):
+        # 启动本地运行器, 读取它打印的监听地址
+        self.proc = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     text=True, encoding="utf-8", errors="replace")
+        found = []
+        def read_addr():
+            for line in self.proc.stdout:
+                if line.startswith("serving "):
+                    found.append(line.split()[1])
+                    break
+        t = threading.Thread(target=read_addr, daemon=True)
+        t.start()
+        t.join(timeout)
+        if not found:
+            self.kill()
+            raise ControlError(f"{self.name}: 运行器启动失败")
+        # 之后的输出不再读取, 交给后台线程丢弃, 避免管道写满阻塞运行器
+        threading.Thread(target=lambda: collections.deque(self.proc.stdout, maxlen=0), daemon=True).start()
+        self.url = found[0]
+        self.client = ControlClient(self.url, self.token)
+        self.fails = 0
+        self.state = "idle"
+
+    def alive(self):
+        return not self.local or (self.proc is not None and self.proc.poll() is None)
+
+    def kill(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+            try: self.proc.wait(5)
+            except subprocess.TimeoutExpired: pass
+
+    def bank_metrics(self):
+        # 运行器即将丢失内存中的统计 (重启/换脚本), 先并入历史
+        if self.metrics_raw: self.history.merge_raw(self.metrics_raw)
+        self.metrics_raw = {}
+        self.steps_base += self.status.get("stats", {}).get("steps", 0)
+        self.status = {}
+
+    def total_steps(self):
+        return self.steps_base + self.status.get("stats", {}).get("steps", 0)
+
+class Coordinator:
+    def __init__(self, scripts, local=0, remote=(), backend="real", loop=False, token=None,
+                 max_restarts=5, extra_args=(), checkpoint_dir=None, log=print):
+        self.queue = collections.deque(scripts)
+        self.loop = loop
+        self.max_restarts = max_restarts
+        self.log = log
+        self.checkpoint_dir = checkpoint_dir
+        self.runners = []
+        self.started = None
+        base = [sys.executable, os.path.join(ROOT, "run_cli.py"), "--serve", "0", "--quiet"]
+        if backend == "stub": base += ["--dry-run", "--no-watchdog"]
+        if token: base += ["--token", token]
+        base += list(extra_args)
+        for i in range(local):
+            name = f"local{i}"
+            cmd = list(base)
+            if checkpoint_dir: cmd += ["--checkpoint", os.path.join(checkpoint_dir, f"{name}.json")]
+            self.runners.append(Runner(name, cmd=cmd, token=token))
+        for i, url in enumerate(remote):
+            self.runners.append(Runner(f"remote{i}", url=url, token=token))
+
+    def start(self):
+        self.started = time.perf_counter()
+        for r in self.runners:
+            if r.local:
+                try: r.spawn()
+                except ControlError as e:
+                    self.log(str(e))
+                    r.state = "dead"
+        self.assign()
+
+    def assign(self):
+        for r in self.runners:
+            if r.state != "idle" or not self.queue: continue
+            script = self.queue.popleft()
+            try:
+                problems = r.client.load(os.path.abspath(script) if r.local else script)["problems"]
+                if problems: self.log(f"{r.name}: {script} 有 {len(problems)} 处问题, 仍然运行")
+                r.client.start(loop=self.loop)
+                r.script = script
+                r.state = "running"
+                self.log(f"{r.name}: 开始 {script}")
+            except ControlError as e:
+                self.log(f"{r.name}: 分配 {script} 失败 ({e})")
+                self.queue.appendleft(script)
+                r.fails += 1
+                if r.fails >= 3: self.mark_down(r)
+
+    def mark_down(self, r):
+        r.bank_metrics()
+        if r.local and r.restarts < self.max_restarts:
+            r.restarts += 1
+            r.kill()
+            self.log(f"{r.name}: 运行器失联, 第 {r.restarts} 次重启")
+            try:
+                r.spawn()
+                if r.script:
+                    # 重新跑原来的脚本, 有断点时从断点继续
+                    r.client.load(os.path.abspath(r.script))
+                    r.client.start(loop=self.loop, resume=bool(self.checkpoint_dir))
+                    r.state = "running"
+                return
+            except ControlError as e: self.log(str(e))
+        r.kill()
+        r.state = "dead"
+        if r.script:
+            self.queue.appendleft(r.script)
+            self.log(f"{r.name}: 放弃该运行器, {r.script} 放回队列")
+            r.script = None
+
+    def poll(self):
+        for r in self.runners:
+            if r.state in ("dead",): continue
+            if not r.alive():
+                self.mark_down(r)
+                continue
+            try:
+                status = r.client.status()
+                if r.state == "running":
+                    r.status = status
+                    r.metrics_raw = r.client.metrics(raw=True)
+                r.fails = 0
+            except ControlError:
+                r.fails += 1
+                if r.fails >= 3: self.mark_down(r)
+                continue
+            if r.state == "running" and not r.status["running"]:
+                stats = r.status.get("stats", {})
+                if stats.get("error"): self.log(f"{r.name}: {r.script} 异常 {stats['error']}")
+                else: self.log(f"{r.name}: 完成 {r.script} ({stats.get('steps', 0)} 步)")
+                r.done += 1
+                r.bank_metrics()
+                r.script = None
+                r.state = "idle"
+        self.assign()
+
+    def finished(self):
+        if self.loop: return False
+        if self.queue: return all(r.state == "dead" for r in self.runners)
+        return all(r.state in ("idle", "dead") for r in self.runners)
+
+    def run(self, duration=0.0, interval=1.0, on_tick=None):
+        self.start()
+        try:
+            while not self.finished():
+                if duration and time.perf_counter() - self.started >= duration: break
+                time.sleep(interval)
+                self.poll()
+                if on_tick: on_tick(self)
+        finally:
+            self.shutdown()
+        return self.report()
+
+    def shutdown(self):
+        for r in self.runners:
+            # 空闲运行器的统计在跑完时已经并入, 不再重复拉取
+            if r.state == "running":
+                try:
+                    r.client.stop()
+                    r.status = r.client.status()
+                    r.metrics_raw = r.client.metrics(raw=True)
+                except ControlError: pass
+            r.bank_metrics()
+            if r.local:
+                try: r.client.shutdown()
+                except (ControlError, AttributeError): pass
+                if r.proc is not None:
+                    try: r.proc.wait(5)
+                    except subprocess.TimeoutExpired: r.kill()
+
+    def aggregate(self):
+        # 所有运行器按阶段合并直方图, 得到整个集群的耗时分布
+        total = MetricsRecorder()
+        for r in self.runners:
+            for raw in (r.history.dump(), r.metrics_raw):
+                for phases in raw.values():
+                    for phase, h in phases.items(): total.merge_raw({phase: {"all": h}})
+        return {phase: st["all"] for phase, st in total.snapshot().items()}
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        steps = sum(r.total_steps() for r in self.runners)
+        return {
+            "elapsed": elapsed,
+            "steps": steps,
+            "steps_per_sec": steps / elapsed if elapsed > 0 else 0.0,
+            "pending": list(self.queue),
+            "runners": [{"name": r.name, "url": r.url, "state": r.state, "script": r.script, "done": r.done,
+                         "restarts": r.restarts, "steps": r.total_steps()} for r in self.runners],
+            "phases": self.aggregate(),
+        }
+
+def print_table(coord, out=sys.stdout):
+    elapsed = time.perf_counter() - coord.started
+    steps = sum(r.total_steps() for r in coord.runners)
+    print(f"[{elapsed:7.1f}s] 总步数 {steps}  {steps / elapsed if elapsed else 0:.1f} 步/秒  队列 {len(coord.queue)}", file=out)
+    for r in coord.runners:
+        print(f"    {r.name:<10}{r.state:<9}{r.total_steps():>8}  重启 {r.restarts}  {r.script or '-'}", file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="waterRPA 多进程调度器")
+    parser.add_argument("scripts", nargs="+", help="任务脚本, 按队列分配给运行器")
+    parser.add_argument("--local", type=int, default=0, help="本机启动的运行器数量")
+    parser.add_argument("--remote", action="append", default=[], help="已在运行的控制接口地址 (可多次指定)")
+    parser.add_argument("--backend", choices=("real", "stub"), default="real",
+                        help="stub: 运行器使用回放画面 + 只记录键鼠动作, 用于本机测试")
+    parser.add_argument("--loop", action="store_true", help="每个运行器无限循环分到的脚本")
+    parser.add_argument("--duration", type=float, default=0.0, help="运行秒数后停止 (0 = 跑完队列)")
+    parser.add_argument("--interval", type=float, default=1.0, help="轮询间隔秒数")
+    parser.add_argument("--max-restarts", type=int, default=5, help="单个本地运行器最多重启次数")
+    parser.add_argument("--checkpoint-dir", help="本地运行器的断点目录, 重启后从断点继续")
+    parser.add_argument("--token", help="控制接口校验口令")
+    parser.add_argument("--quiet", action="store_true", help="不打印周期状态表")
+    parser.add_argument("--out", help="汇总结果 JSON 输出路径")
+    args = parser.parse_args(argv)
+
+    if args.local <= 0 and not args.remote:
+        print("需要 --local 或 --remote", file=sys.stderr)
+        return 2
+    if args.loop and not args.duration: print("循环模式: Ctrl+C 停止", file=sys.stderr)
+    if args.checkpoint_dir: os.makedirs(args.checkpoint_dir, exist_ok=True)
+
+    coord = Coordinator(args.scripts, args.local, args.remote, args.backend, args.loop, args.token,
+                        args.max_restarts, checkpoint_dir=args.checkpoint_dir)
+    ticks = [0]
+    def on_tick(c):
+        ticks[0] += 1
+        if not args.quiet and ticks[0] % max(int(5 / args.interval), 1) == 0: print_table(c)
+    try: report = coord.run(args.duration, args.interval, on_tick)
+    except KeyboardInterrupt:
+        coord.shutdown()
+        report = coord.report()
+
+    print(f"总步数: {report['steps']}  吞吐: {report['steps_per_sec']:.1f} 步/秒  耗时: {report['elapsed']:.1f}s")
+    print(f"{'阶段':<12}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for phase, st in report["phases"].items():
+        print(f"{phase:<12}{st['count']:>8}{st['p50'] * 1000:>10.2f}{st['p95'] * 1000:>10.2f}{st['p99'] * 1000:>10.2f}")
+    for r in report["runners"]:
+        print(f"{r['name']:<10}{r['state']:<9}完成 {r['done']}  重启 {r['restarts']}  {r['steps']} 步")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    if report["pending"] or any(r["state"] == "dead" for r in report["runners"]): return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
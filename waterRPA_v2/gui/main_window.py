@@ -5,8 +5,8 @@ import ctypes
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                                QPushButton, QLabel, QComboBox, QLineEdit, 
                                QFileDialog, QMessageBox, QCheckBox, QGroupBox,
-                               QTextEdit, QListWidgetItem)
-from PySide6.QtCore import Qt, QTimer, QSettings
+                               QTextEdit)
+from PySide6.QtCore import QTimer, QSettings
 
 # Check for psutil
 try:
@@ -16,7 +16,11 @@ except ImportError:
     HAS_PSUTIL = False
 
 # Windows API
-GetAsyncKeyState = ctypes.windll.user32.GetAsyncKeyState
+try:
+    GetAsyncKeyState = ctypes.windll.user32.GetAsyncKeyState
+    HAS_WINAPI = True
+except AttributeError:
+    HAS_WINAPI = False
 try:
     GetCurrentProcessorNumber = ctypes.windll.kernel32.GetCurrentProcessorNumber
     GetCurrentProcessorNumber.restype = ctypes.c_ulong
@@ -25,9 +29,11 @@ except:
     HAS_KERNEL_CPU = False
 
 from ..config import GLOBAL_CONFIG
-from ..utils import get_log_path
-from ..engine import RPAEngine
-from .widgets import RegionWindow, HelpBtn, TaskRow, DraggableListWidget, WorkerThread
+from ..utils import get_log_path, get_output_path
+from ..engine import RPAEngine, RUN_ONLY_PARAMS
+from ..bundle import save_bundle, load_bundle
+from ..loader import validate_task, validate_tasks
+from .widgets import RegionWindow, HelpBtn, TaskListModel, TaskListView, WorkerThread, MetricsPanel, LoaderThread
 
 class RPAWindow(QMainWindow):
     def __init__(self):
@@ -55,9 +61,9 @@ class RPAWindow(QMainWindow):
         save_btn = QPushButton("保存")
         save_btn.clicked.connect(self.save)
         top_bar.addWidget(save_btn)
-        load_btn = QPushButton("导入")
-        load_btn.clicked.connect(self.load)
-        top_bar.addWidget(load_btn)
+        self.load_btn = QPushButton("导入")
+        self.load_btn.clicked.connect(self.load)
+        top_bar.addWidget(self.load_btn)
         
         # 设定区域
         region_btn = QPushButton("📷 设定识别区域")
@@ -65,6 +71,11 @@ class RPAWindow(QMainWindow):
         region_btn.clicked.connect(self.open_region_selector)
         top_bar.addWidget(region_btn)
         
+        metrics_btn = QPushButton("📊 耗时统计")
+        metrics_btn.clicked.connect(self.open_metrics_panel)
+        top_bar.addWidget(metrics_btn)
+        self.metrics_panel = None
+        
         top_bar.addStretch()
         main_layout.addLayout(top_bar)
 
@@ -79,7 +90,11 @@ class RPAWindow(QMainWindow):
         self.scale_min = QLineEdit(self.settings.value("scale_min", "0.8")); self.scale_min.setFixedWidth(50); gl1.addWidget(self.scale_min)
         gl1.addWidget(QLabel("-")); 
         self.scale_max = QLineEdit(self.settings.value("scale_max", "1.2")); self.scale_max.setFixedWidth(50); gl1.addWidget(self.scale_max)
-        gl1.addWidget(HelpBtn("【缩放范围】\n程序启动时会预先生成缩放模板缓存。\n范围越小，启动越快，内存占用越小。"))
+        gl1.addWidget(HelpBtn("【缩放范围】\n程序启动时会预先生成缩放模板缓存。\n范围越小，启动越快，内存占用越小。\n首次找到后会记住每张图的实际缩放，之后只扫该缩放附近，\n连续多次找不到再完整扫一遍。校准结果随脚本保存。"))
+        gl1.addSpacing(20)
+        gl1.addWidget(QLabel("画面缩小:"))
+        self.downscale = QLineEdit(self.settings.value("downscale", "1.0")); self.downscale.setFixedWidth(40); gl1.addWidget(self.downscale)
+        gl1.addWidget(HelpBtn("【画面缩小】\n高分屏 (如 4K 150%) 截图很大，而图片是在 100% 缩放下截的。\n截图先整体缩小该倍数再找图，点击坐标自动换算回物理像素。\n1.0=不缩小，0=按系统缩放比例自动，也可直接填 1.5 / 2。"))
         gl1.addStretch()
         g1.setLayout(gl1)
         main_layout.addWidget(g1)
@@ -115,9 +130,15 @@ class RPAWindow(QMainWindow):
         gl2.addWidget(QLabel("按住(s):")); self.click_hld = QLineEdit(self.settings.value("click_hld", "0.04")); self.click_hld.setFixedWidth(50); gl2.addWidget(self.click_hld)
         gl2.addWidget(HelpBtn("【按住时长】\nFlash游戏建议 0.04-0.08。"))
         gl2.addWidget(QLabel("缓冲(s):")); self.settle = QLineEdit(self.settings.value("settle", "0.0")); self.settle.setFixedWidth(50); gl2.addWidget(self.settle)
-        gl2.addWidget(HelpBtn("【结算缓冲】\n点击后的等待时间。"))
+        self.settle_chk = QCheckBox("自适应")
+        self.settle_chk.setChecked(self.settings.value("adaptive_settle", False, type=bool))
+        gl2.addWidget(self.settle_chk)
+        gl2.addWidget(HelpBtn("【结算缓冲】\n点击后的等待时间。\n勾选【自适应】后改为观察点击点附近的画面：\n画面有变化并稳定下来就立即继续，缓冲时间只作为最长等待。\n画面始终不变时仍会等满。"))
         gl2.addWidget(QLabel("超时(s):")); self.timeout = QLineEdit(self.settings.value("timeout", "0.0")); self.timeout.setFixedWidth(50); gl2.addWidget(self.timeout)
         gl2.addWidget(HelpBtn("【单步超时】\n0.0=扫一眼没找到直接过。"))
+        gl2.addWidget(QLabel("轮询上限(s):")); self.poll_lat = QLineEdit(self.settings.value("poll_lat", "0.2")); self.poll_lat.setFixedWidth(50); gl2.addWidget(self.poll_lat)
+        gl2.addWidget(QLabel("CPU占比:")); self.poll_cpu = QLineEdit(self.settings.value("poll_cpu", "0.5")); self.poll_cpu.setFixedWidth(40); gl2.addWidget(self.poll_cpu)
+        gl2.addWidget(HelpBtn("【自适应轮询】\n超时内重复找图时，画面静止或目标久未出现会逐步放慢，\n画面一变立即恢复全速。\n轮询上限=最慢多久找一次 (目标出现后的最大延迟)，\nCPU占比=找图耗时占比上限。\n单个指令可在脚本里用 latency / cpu 字段覆盖。"))
         gl2.addStretch()
         g2.setLayout(gl2)
         main_layout.addWidget(g2)
@@ -147,14 +168,30 @@ class RPAWindow(QMainWindow):
         self.log_ui_chk = QCheckBox("显示界面日志"); 
         self.log_ui_chk.setChecked(self.settings.value("log_ui", True, type=bool))
         gl3.addWidget(self.log_ui_chk)
+        self.metrics_file_chk = QCheckBox("导出耗时统计")
+        self.metrics_file_chk.setChecked(self.settings.value("metrics_file", False, type=bool))
+        gl3.addWidget(self.metrics_file_chk)
+        self.trace_chk = QCheckBox("性能追踪")
+        self.trace_chk.setChecked(self.settings.value("trace", False, type=bool))
+        gl3.addWidget(self.trace_chk)
+        gl3.addWidget(HelpBtn("【性能追踪】\n记录每一步/截图/匹配/点击的时间片，\n运行结束后写出 rpa_trace_*.json，\n可用 chrome://tracing 或 ui.perfetto.dev 打开。"))
+        self.ckpt_chk = QCheckBox("断点续跑")
+        self.ckpt_chk.setChecked(self.settings.value("checkpoint", False, type=bool))
+        gl3.addWidget(self.ckpt_chk)
+        gl3.addWidget(HelpBtn("【断点续跑】\n运行中定期记录当前步骤和循环次数，\n模板缓存写入 rpa_checkpoint.cache.rpab。\n被急停或程序崩溃后点【继续】，\n从中断的那一步接着跑，不用重新预加载。"))
         self.log_file_chk.stateChanged.connect(self.update_log_config)
         self.log_ui_chk.stateChanged.connect(self.update_log_config)
+        self.metrics_file_chk.stateChanged.connect(self.update_log_config)
         gl3.addStretch()
         g3.setLayout(gl3)
         main_layout.addWidget(g3)
 
         # 任务列表
-        self.task_list = DraggableListWidget()
+        self.task_model = TaskListModel(self)
+        self.loader = None
+        self.stale_loaders = []  # 已取消但线程还没退出的导入, 保留引用直到结束
+        self.task_list = TaskListView()
+        self.task_list.setModel(self.task_model)
         main_layout.addWidget(self.task_list)
         
         # 底部
@@ -169,6 +206,10 @@ class RPAWindow(QMainWindow):
         self.start_btn.setStyleSheet("background-color: #4CAF50; color: white; font-weight: bold;")
         bot_layout.addWidget(self.start_btn)
         
+        self.resume_btn = QPushButton("继续"); self.resume_btn.clicked.connect(lambda: self.start_task(resume=True))
+        self.resume_btn.setToolTip("从上次的断点继续 (需勾选【断点续跑】)")
+        bot_layout.addWidget(self.resume_btn)
+        
         self.stop_btn = QPushButton("停止"); self.stop_btn.clicked.connect(self.stop_task)
         self.stop_btn.setStyleSheet("background-color: #f44336; color: white; font-weight: bold;")
         self.stop_btn.setEnabled(False)
@@ -177,6 +218,7 @@ class RPAWindow(QMainWindow):
         main_layout.addLayout(bot_layout)
         
         self.log_text = QTextEdit(); self.log_text.setMaximumHeight(80)
+        self.log_text.document().setMaximumBlockCount(GLOBAL_CONFIG["log_max_lines"])
         main_layout.addWidget(self.log_text)
         
         # 状态栏
@@ -202,6 +244,15 @@ class RPAWindow(QMainWindow):
         self.update_log_config()
         self.update_hotkey_display(self.hotkey_combo.currentText())
 
+        # 运行中修改参数直接热更新, 不用停下重来
+        for edit in (self.conf_edit, self.scale_min, self.scale_max, self.dodge_x1, self.dodge_y1, self.dodge_x2,
+                     self.dodge_y2, self.dbl_wait, self.move_spd, self.click_hld, self.settle, self.timeout,
+                     self.poll_lat, self.poll_cpu, self.downscale):
+            edit.editingFinished.connect(self.apply_live_params)
+        for chk in (self.dodge_chk, self.double_dodge_chk, self.tm_failsafe, self.tr_failsafe, self.key_failsafe,
+                    self.settle_chk):
+            chk.toggled.connect(self.apply_live_params)
+
         # 快捷键轮询
         self.hotkey_timer = QTimer()
         self.hotkey_timer.timeout.connect(self.check_hotkey)
@@ -216,6 +267,7 @@ class RPAWindow(QMainWindow):
         except: pass
 
     def check_hotkey(self):
+        if not HAS_WINAPI: return
         if GetAsyncKeyState(self.hotkey_vk) & 0x8000:
             if self.engine.is_running:
                 self.stop_task()
@@ -224,6 +276,12 @@ class RPAWindow(QMainWindow):
             self.hotkey_timer.stop()
             QTimer.singleShot(500, lambda: self.hotkey_timer.start(100))
 
+    def open_metrics_panel(self):
+        if self.metrics_panel is None: self.metrics_panel = MetricsPanel(self.engine)
+        self.metrics_panel.show()
+        self.metrics_panel.raise_()
+        self.metrics_panel.refresh()
+
     def open_region_selector(self):
         self.region_win = RegionWindow()
         self.region_win.region_selected.connect(self.on_region_selected)
@@ -237,6 +295,7 @@ class RPAWindow(QMainWindow):
         self.settings.setValue("conf", self.conf_edit.text())
         self.settings.setValue("scale_min", self.scale_min.text())
         self.settings.setValue("scale_max", self.scale_max.text())
+        self.settings.setValue("downscale", self.downscale.text())
         self.settings.setValue("dodge_x1", self.dodge_x1.text())
         self.settings.setValue("dodge_y1", self.dodge_y1.text())
         self.settings.setValue("dodge_x2", self.dodge_x2.text())
@@ -247,9 +306,15 @@ class RPAWindow(QMainWindow):
         self.settings.setValue("move_spd", self.move_spd.text())
         self.settings.setValue("click_hld", self.click_hld.text())
         self.settings.setValue("settle", self.settle.text())
+        self.settings.setValue("adaptive_settle", self.settle_chk.isChecked())
         self.settings.setValue("timeout", self.timeout.text())
+        self.settings.setValue("poll_lat", self.poll_lat.text())
+        self.settings.setValue("poll_cpu", self.poll_cpu.text())
         self.settings.setValue("log_file", self.log_file_chk.isChecked())
         self.settings.setValue("log_ui", self.log_ui_chk.isChecked())
+        self.settings.setValue("metrics_file", self.metrics_file_chk.isChecked())
+        self.settings.setValue("trace", self.trace_chk.isChecked())
+        self.settings.setValue("checkpoint", self.ckpt_chk.isChecked())
         self.settings.setValue("mini", self.mini_chk.isChecked())
         self.settings.setValue("hotkey", self.hotkey_combo.currentText())
         event.accept()
@@ -257,6 +322,7 @@ class RPAWindow(QMainWindow):
     def update_log_config(self):
         GLOBAL_CONFIG["log_to_file"] = self.log_file_chk.isChecked()
         GLOBAL_CONFIG["log_to_ui"] = self.log_ui_chk.isChecked()
+        GLOBAL_CONFIG["metrics_to_file"] = self.metrics_file_chk.isChecked()
 
     def update_cpu_info(self):
         core_str = "?"
@@ -274,86 +340,135 @@ class RPAWindow(QMainWindow):
         self.cpu_label.setText(f"逻辑核心: #{core_str} | 系统总占: {sys_usage}% | 脚本单核占: {proc_usage}%")
 
     def add_row(self, data=None):
-        row_widget = TaskRow(delete_callback=self.del_row)
-        if data: row_widget.set_data(data)
-        item = QListWidgetItem(self.task_list)
-        item.setSizeHint(row_widget.sizeHint())
-        self.task_list.setItemWidget(item, row_widget)
-        row_widget.set_parent_item(item)
-        item.setData(Qt.UserRole, row_widget.get_data())
-
-    def restore_row_widget(self, item, data):
-        row_widget = TaskRow(delete_callback=self.del_row)
-        row_widget.set_data(data)
-        item.setSizeHint(row_widget.sizeHint())
-        self.task_list.setItemWidget(item, row_widget)
-        row_widget.set_parent_item(item)
-
-    def del_row(self, row_widget):
-        for i in range(self.task_list.count()):
-            item = self.task_list.item(i)
-            if self.task_list.itemWidget(item) == row_widget:
-                self.task_list.takeItem(i)
-                break
+        self.task_model.append_tasks([data or {"type": 1.0, "value": ""}])
+        self.task_list.setCurrentIndex(self.task_model.index(self.task_model.rowCount() - 1))
 
     def save(self):
-        tasks = []
-        for i in range(self.task_list.count()):
-            item = self.task_list.item(i)
-            widget = self.task_list.itemWidget(item)
-            if widget: tasks.append(widget.get_data())
-            else: tasks.append(item.data(Qt.UserRole))
-        path, _ = QFileDialog.getSaveFileName(self, "保存", filter="JSON (*.json)")
-        if path:
+        tasks = self.task_model.get_tasks()
+        if self.engine.store_scales(tasks): self.task_model.update_scales(tasks)  # 带上缩放校准结果
+        path, _ = QFileDialog.getSaveFileName(self, "保存", filter="JSON (*.json);;脚本包 (*.rpab)")
+        if not path: return
+        if path.lower().endswith(".rpab"):
+            # 脚本包: 连同参数与预处理好的模板一起保存
+            # 用单独的引擎实例预处理, 运行中保存也不会清掉正在用的模板缓存
+            builder = RPAEngine()
+            try: builder.apply_params(self.collect_params())
+            except ValueError as e: return QMessageBox.warning(self, "错误", f"数值格式错误\n{e}")
+            n = save_bundle(path, tasks, builder)
+            self.log_text.append(f"已打包 {len(tasks)} 条指令, {n} 个模板: {path}")
+        else:
             with open(path, 'w', encoding='utf-8') as f: json.dump(tasks, f, ensure_ascii=False, indent=2)
 
     def load(self):
-        path, _ = QFileDialog.getOpenFileName(self, "导入", filter="JSON (*.json)")
-        if path:
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.task_list.clear()
-                for d in data: self.add_row(d)
+        # 导入会换掉引擎的脚本包和模板缓存, 运行中不允许
+        if self.engine.is_running: return
+        path, _ = QFileDialog.getOpenFileName(self, "导入", filter="脚本 (*.json *.rpab)")
+        if not path: return
+        if self.engine.bundle: self.engine.bundle.close()
+        if self.loader:
+            # 上一次导入还没读完: 停掉, 已经排队的批次由 sender 检查丢弃
+            self.loader.cancelled = True
+            self.stale_loaders = [t for t in self.stale_loaders if t.isRunning()]
+            if self.loader.isRunning(): self.stale_loaders.append(self.loader)
+            self.loader = None
+        if path.lower().endswith(".rpab"):
+            try: bundle = load_bundle(path)
+            except (OSError, ValueError) as e: return QMessageBox.warning(self, "错误", f"脚本包读取失败\n{e}")
+            self.engine.use_bundle(bundle)
+            # 使用打包时的识别参数, 缩放范围一致时无需重新计算模板
+            params = bundle.params
+            if "confidence" in params: self.conf_edit.setText(str(params["confidence"]))
+            self.scale_min.setText(str(bundle.min_scale))
+            self.scale_max.setText(str(bundle.max_scale))
+            known = self.task_model.known_paths = set(bundle.gray)
+            self.task_model.set_tasks([])
+            self.task_model.append_tasks(bundle.tasks, ["; ".join(validate_task(t, known)) for t in bundle.tasks])
+        else:
+            self.engine.use_bundle(None)
+            self.task_model.known_paths = ()
+            self.task_model.set_tasks([])
+            self.loader = LoaderThread(path)
+            self.loader.rows_loaded.connect(self.on_rows_loaded)
+            self.loader.load_done.connect(self.on_load_done)
+            self.loader.load_failed.connect(self.on_load_failed)
+            self.loader.start()
 
-    def start_task(self):
-        tasks = []
-        for i in range(self.task_list.count()):
-            item = self.task_list.item(i)
-            widget = self.task_list.itemWidget(item)
-            if widget: tasks.append(widget.get_data())
+    def on_rows_loaded(self, tasks, issues):
+        if self.sender() is not self.loader: return  # 已被取消的导入
+        self.task_model.append_tasks(tasks, issues)
+
+    def on_load_failed(self, msg):
+        if self.sender() is not self.loader: return
+        QMessageBox.warning(self, "错误", f"导入失败\n{msg}")
+
+    def on_load_done(self, count, bad):
+        if self.sender() is not self.loader: return
+        if bad: self.log_text.append(f"已导入 {count} 条指令, 其中 {bad} 条有问题 (红色标出)")
+        else: self.log_text.append(f"已导入 {count} 条指令")
+
+    def collect_params(self):
+        return {
+            "min_scale": self.scale_min.text(),
+            "max_scale": self.scale_max.text(),
+            "match_downscale": self.downscale.text(),
+            "dodge_x1": self.dodge_x1.text(),
+            "dodge_y1": self.dodge_y1.text(),
+            "dodge_x2": self.dodge_x2.text(),
+            "dodge_y2": self.dodge_y2.text(),
+            "move_duration": self.move_spd.text(),
+            "click_hold": self.click_hld.text(),
+            "settlement_wait": self.settle.text(),
+            "adaptive_settle": self.settle_chk.isChecked(),
+            "timeout_val": self.timeout.text(),
+            "poll_latency": self.poll_lat.text(),
+            "poll_cpu": self.poll_cpu.text(),
+            "confidence": self.conf_edit.text(),
+            "enable_dodge": self.dodge_chk.isChecked(),
+            "enable_double_dodge": self.double_dodge_chk.isChecked(),
+            "double_dodge_wait": self.dbl_wait.text(),
+            "enable_tm_stop": self.tm_failsafe.isChecked(),
+            "enable_tr_stop": self.tr_failsafe.isChecked(),
+            "enable_key_stop": self.key_failsafe.isChecked(),
+            "enable_trace": self.trace_chk.isChecked(),
+            "checkpoint_path": get_output_path("rpa_checkpoint.json") if self.ckpt_chk.isChecked() else None,
+        }
+
+    def apply_live_params(self):
+        if not self.engine.is_running: return
+        # 追踪/断点只在启动时读取, 不跟着热更新排队
+        params = {k: v for k, v in self.collect_params().items() if k not in RUN_ONLY_PARAMS}
+        try: changed = self.engine.update_params(params)
+        except ValueError as e:
+            self.log_text.append(f"参数未生效: {e}")
+            return
+        if changed: self.log_text.append(f"参数将在下一步生效: {', '.join(changed)}")
+
+    def start_task(self, resume=False):
+        if self.loader and self.loader.isRunning(): return
+        tasks = self.task_model.get_tasks()
         if not tasks: return
+        problems = validate_tasks(tasks, self.task_model.known_paths)
+        if problems:
+            lines = [f"第 {idx + 1} 步: {msg}" for idx, msg in problems[:10]]
+            if len(problems) > 10: lines.append(f"... 共 {len(problems)} 处")
+            ret = QMessageBox.question(self, "脚本检查", "发现以下问题, 仍然启动?\n\n" + "\n".join(lines))
+            if ret != QMessageBox.Yes: return
         try:
-            self.engine.min_scale = float(self.scale_min.text())
-            self.engine.max_scale = float(self.scale_max.text())
-            self.engine.dodge_x1 = int(self.dodge_x1.text())
-            self.engine.dodge_y1 = int(self.dodge_y1.text())
-            self.engine.dodge_x2 = int(self.dodge_x2.text())
-            self.engine.dodge_y2 = int(self.dodge_y2.text())
-            self.engine.move_duration = float(self.move_spd.text())
-            self.engine.click_hold = float(self.click_hld.text())
-            self.engine.settlement_wait = float(self.settle.text())
-            self.engine.timeout_val = float(self.timeout.text())
-            self.engine.confidence = float(self.conf_edit.text())
-            
-            self.engine.enable_dodge = self.dodge_chk.isChecked()
-            self.engine.enable_double_dodge = self.double_dodge_chk.isChecked()
-            self.engine.double_dodge_wait = float(self.dbl_wait.text())
-            
-            self.engine.enable_tm_stop = self.tm_failsafe.isChecked()
-            self.engine.enable_tr_stop = self.tr_failsafe.isChecked()
-            self.engine.enable_key_stop = self.key_failsafe.isChecked()
-        except: return QMessageBox.warning(self, "错误", "数值格式错误")
+            self.engine.apply_params(self.collect_params())
+        except ValueError as e: return QMessageBox.warning(self, "错误", f"数值格式错误\n{e}")
 
         if GLOBAL_CONFIG["log_to_ui"]:
             self.log_text.clear()
             self.log_text.append(f">>> 引擎启动({self.hotkey_combo.currentText()})...")
             
         self.start_btn.setEnabled(False)
+        self.resume_btn.setEnabled(False)
+        self.load_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
         if self.mini_chk.isChecked(): self.showMinimized()
         
         is_loop = self.loop_combo.currentText() == "无限"
-        self.worker = WorkerThread(self.engine, tasks, is_loop)
+        self.worker = WorkerThread(self.engine, tasks, is_loop, resume=bool(resume) and self.ckpt_chk.isChecked())
         self.worker.log_signal.connect(self.log_text.append)
         self.worker.finished_signal.connect(self.on_finish)
         self.worker.start()
@@ -363,6 +478,8 @@ class RPAWindow(QMainWindow):
         
     def on_finish(self):
         self.start_btn.setEnabled(True)
+        self.resume_btn.setEnabled(True)
+        self.load_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.showNormal()
         self.activateWindow()
@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 from PySide6.QtWidgets import (QApplication, QWidget, QPushButton, QLabel, QComboBox, QLineEdit, 
-                               QFileDialog, QFrame,  QToolTip, QListWidget, QListWidgetItem, QAbstractItemView, QHBoxLayout)
-from PySide6.QtCore import Qt, Signal, QPoint, QRect, QThread, QSize
+                               QFileDialog, QFrame,  QToolTip, QListView, QAbstractItemView, QHBoxLayout,
+                               QVBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QStyledItemDelegate)
+from PySide6.QtCore import Qt, Signal, QPoint, QRect, QThread, QSize, QTimer, QAbstractListModel, QModelIndex
 from PySide6.QtGui import QCursor, QFont, QColor, QPen, QPainter, QRegion
-import pyautogui
+import threading
 
-from ..config import GLOBAL_CONFIG
+from ..config import GLOBAL_CONFIG, TASK_TYPES
+from ..utils import LogBatcher, physical_scale
 from ..engine import FailsafeWatchdog
+from ..loader import iter_json_array, validate_task
 
 # --------------------------
 # 区域选择窗口
@@ -26,11 +29,7 @@ class RegionWindow(QWidget):
         virtual_rect = QApplication.primaryScreen().virtualGeometry()
         self.setGeometry(virtual_rect)
         
-        phys_w, phys_h = pyautogui.size()
-        log_w = virtual_rect.width()
-        log_h = virtual_rect.height()
-        self.scale_x = phys_w / log_w
-        self.scale_y = phys_h / log_h
+        self.scale_x, self.scale_y = physical_scale(virtual_rect.width(), virtual_rect.height())
         
         self.start_point = None
         self.end_point = None
@@ -132,25 +131,123 @@ class HelpBtn(QPushButton):
     def show_tip(self):
         QToolTip.showText(QCursor.pos(), self.tip_text, self, QRect(), 5000)
 
-class TaskRow(QFrame):
-    move_up_signal = Signal(object)
-    move_down_signal = Signal(object)
-    
-    def __init__(self, delete_callback):
-        super().__init__()
-        self.parent_item = None
+# --------------------------
+# 任务列表 (Model/View)
+# 数据只保存在模型里, 编辑器控件只为正在编辑的那一行创建
+# --------------------------
+class TaskListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tasks = []
+        self.issues = {}        # id(task) -> 问题描述
+        self.known_paths = ()   # 脚本包里已有的模板路径
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.tasks)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid(): return None
+        task = self.tasks[index.row()]
+        if role == Qt.DisplayRole:
+            text = f"{index.row() + 1:>4}.  {TASK_TYPES.get(task.get('type'), task.get('type'))}    {task.get('value', '')}"
+            issue = self.issues.get(id(task))
+            return f"{text}    ⚠ {issue}" if issue else text
+        if role == Qt.ForegroundRole and id(task) in self.issues:
+            return QColor(220, 0, 0)
+        if role == Qt.ToolTipRole:
+            return self.issues.get(id(task))
+        if role in (Qt.EditRole, Qt.UserRole):
+            return task
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role not in (Qt.EditRole, Qt.UserRole): return False
+        self.issues.pop(id(self.tasks[index.row()]), None)
+        self.tasks[index.row()] = value
+        issues = validate_task(value, self.known_paths)
+        if issues: self.issues[id(value)] = "; ".join(issues)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def flags(self, index):
+        if not index.isValid(): return Qt.ItemIsDropEnabled
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable | Qt.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.MoveAction | Qt.CopyAction
+
+    def set_tasks(self, tasks):
+        self.beginResetModel()
+        self.tasks = [dict(t) for t in tasks]
+        self.issues = {}
+        self.endResetModel()
+
+    def get_tasks(self):
+        return [dict(t) for t in self.tasks]
+
+    def update_scales(self, tasks):
+        # 只写回 scale 字段, 不重置模型: 问题标记和打开的编辑器都保留
+        for row, (task, new) in enumerate(zip(self.tasks, tasks)):
+            if "scale" in new and task.get("scale") != new["scale"]:
+                task["scale"] = new["scale"]
+                self.dataChanged.emit(self.index(row), self.index(row), [Qt.UserRole])
+
+    def append_tasks(self, tasks, issues=None):
+        if not tasks: return
+        first = len(self.tasks)
+        self.beginInsertRows(QModelIndex(), first, first + len(tasks) - 1)
+        for i, t in enumerate(tasks):
+            task = dict(t)
+            self.tasks.append(task)
+            if issues and issues[i]: self.issues[id(task)] = issues[i]
+        self.endInsertRows()
+
+    def remove_row(self, row):
+        if not 0 <= row < len(self.tasks): return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.issues.pop(id(self.tasks[row]), None)
+        del self.tasks[row]
+        self.endRemoveRows()
+        self._renumber(row)
+
+    def move_row(self, src, dst):
+        # dst 为移动前的插入位置 (0..len)
+        if not 0 <= src < len(self.tasks) or dst in (src, src + 1): return False
+        if not self.beginMoveRows(QModelIndex(), src, src, QModelIndex(), dst): return False
+        task = self.tasks.pop(src)
+        self.tasks.insert(dst - 1 if dst > src else dst, task)
+        self.endMoveRows()
+        self._renumber(min(src, dst))
+        return True
+
+    def _renumber(self, first):
+        # 显示文本带行号, 增删移动后刷新受影响的行
+        if first < len(self.tasks):
+            self.dataChanged.emit(self.index(first), self.index(len(self.tasks) - 1), [Qt.DisplayRole])
+
+class TaskEditor(QFrame):
+    changed = Signal()
+    delete_requested = Signal()
+    PLACEHOLDERS = {
+        "等待颜色": "x,y,#RRGGBB[,容差]  区域: x,y,w,h,#RRGGBB  多个用 ; 分隔",
+        "颜色跳转": "x,y,#RRGGBB[,容差] -> 成立跳到第N步[|不成立跳到第M步]",
+    }
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
         self.setFrameShape(QFrame.StyledPanel)
+        self.setAutoFillBackground(True)
         self.layout = QHBoxLayout(self)
         self.layout.setContentsMargins(2, 2, 2, 2)
         
         self.type_combo = QComboBox()
-        self.type_combo.addItems(["左键单击", "左键双击", "右键单击", "输入文本", "等待(秒)", "滚轮滑动", "系统按键", "鼠标悬停", "截图保存"])
+        self.type_combo.addItems(list(TASK_TYPES.values()))
         self.type_combo.currentTextChanged.connect(self.on_type_changed)
         self.layout.addWidget(self.type_combo)
         
         self.value_input = QLineEdit()
         self.value_input.setPlaceholderText("参数")
-        self.value_input.textChanged.connect(self.sync_data)
+        self.value_input.textChanged.connect(self.changed)
         self.layout.addWidget(self.value_input)
         
         self.file_btn = QPushButton("选择")
@@ -160,74 +257,222 @@ class TaskRow(QFrame):
         self.del_btn = QPushButton("X")
         self.del_btn.setStyleSheet("color: red; font-weight: bold;")
         self.del_btn.setFixedWidth(25)
-        self.del_btn.clicked.connect(lambda: delete_callback(self))
+        self.del_btn.clicked.connect(self.delete_requested)
         self.layout.addWidget(self.del_btn)
         
         self.on_type_changed(self.type_combo.currentText())
 
-    def set_parent_item(self, item):
-        self.parent_item = item
-        self.sync_data() 
-
-    def sync_data(self):
-        if getattr(self, 'parent_item', None):
-            self.parent_item.setData(Qt.UserRole, self.get_data())
-
     def on_type_changed(self, text):
         self.file_btn.setVisible("单击" in text or "悬停" in text or "截图" in text)
-        self.sync_data()
+        self.value_input.setPlaceholderText(self.PLACEHOLDERS.get(text, "参数"))
+        self.changed.emit()
             
     def set_data(self, data):
-        self.value_input.setText(str(data.get("value", "")))
-        TYPES_REV = {1.0: "左键单击", 2.0: "左键双击", 3.0: "右键单击", 4.0: "输入文本", 5.0: "等待(秒)", 6.0: "滚轮滑动", 7.0: "系统按键", 8.0: "鼠标悬停", 9.0: "截图保存"}
+        # 编辑即提交, 模型回写时会再调到这里; 内容没变就不动, 否则 setText 会把光标挪到末尾
+        self.blockSignals(True)
+        text = str(data.get("value", ""))
+        if self.value_input.text() != text: self.value_input.setText(text)
         t = data.get("type", 1.0)
-        if t in TYPES_REV:
-            self.type_combo.setCurrentText(TYPES_REV[t])
+        if t in TASK_TYPES and self.type_combo.currentText() != TASK_TYPES[t]:
+            self.type_combo.setCurrentText(TASK_TYPES[t])
+        self.blockSignals(False)
 
     def select_file(self):
         path, _ = QFileDialog.getOpenFileName(self, "选择", filter="Images (*.png *.jpg *.bmp)")
         if path: self.value_input.setText(path)
 
     def get_data(self):
-        TYPES = {"左键单击": 1.0, "左键双击": 2.0, "右键单击": 3.0, "输入文本": 4.0, "等待(秒)": 5.0, "滚轮滑动": 6.0, "系统按键": 7.0, "鼠标悬停": 8.0, "截图保存": 9.0}
+        TYPES = {name: code for code, name in TASK_TYPES.items()}
         val = self.value_input.text()
         t = TYPES.get(self.type_combo.currentText(), 1.0)
         if t in [5.0, 6.0] and not val: val = "0"
         return {"type": t, "value": val}
 
-class DraggableListWidget(QListWidget):
+class TaskDelegate(QStyledItemDelegate):
+    ROW_HEIGHT = 34
+
+    def createEditor(self, parent, option, index):
+        editor = TaskEditor(parent)
+        # 编辑即提交, 启动/保存时直接读模型
+        editor.changed.connect(lambda: self.commitData.emit(editor))
+        editor.delete_requested.connect(lambda: self.delete_row(editor))
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.set_data(index.data(Qt.EditRole))
+
+    def setModelData(self, editor, model, index):
+        task = dict(index.data(Qt.EditRole))  # 保留 retry 等额外字段
+        task.update(editor.get_data())
+        model.setData(index, task)
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(option.rect)
+
+    def sizeHint(self, option, index):
+        return QSize(200, self.ROW_HEIGHT)
+
+    def delete_row(self, editor):
+        view = self.parent()
+        index = view.indexAt(editor.geometry().center())
+        if index.isValid(): view.model().remove_row(index.row())
+
+class TaskListView(QListView):
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.setUniformItemSizes(True)
         self.setDragDropMode(QAbstractItemView.InternalMove)
         self.setDefaultDropAction(Qt.MoveAction)
+        self.setDragDropOverwriteMode(False)
+        self.setDropIndicatorShown(True)
         self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setEditTriggers(QAbstractItemView.CurrentChanged | QAbstractItemView.DoubleClicked | QAbstractItemView.SelectedClicked)
+        self.setItemDelegate(TaskDelegate(self))
 
     def dropEvent(self, event):
-        super().dropEvent(event)
-        for i in range(self.count()):
-            item = self.item(i)
-            if self.itemWidget(item) is None:
-                data = item.data(Qt.UserRole)
-                if data:
-                    self.window().restore_row_widget(item, data)
+        # 自己完成移动, 并以 CopyAction 结束拖拽, 防止视图再删除源行
+        if event.source() is not self:
+            event.ignore()
+            return
+        src = self.currentIndex().row()
+        target = self.indexAt(event.position().toPoint())
+        if target.isValid():
+            dst = target.row()
+            if self.dropIndicatorPosition() == QAbstractItemView.BelowItem: dst += 1
+        else:
+            dst = self.model().rowCount()
+        if src >= 0 and self.model().move_row(src, dst):
+            self.setCurrentIndex(self.model().index(dst - 1 if dst > src else dst))
+        event.setDropAction(Qt.CopyAction)
+        event.accept()
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Delete and self.state() != QAbstractItemView.EditingState and self.currentIndex().isValid():
+            self.model().remove_row(self.currentIndex().row())
+            return
+        super().keyPressEvent(event)
+
+# --------------------------
+# 后台导入: 边解析边校验, 分批把行推给模型
+# --------------------------
+class LoaderThread(QThread):
+    rows_loaded = Signal(list, list)  # 任务, 每行的问题描述 ("" 表示没问题)
+    load_done = Signal(int, int)      # 总行数, 有问题的行数
+    load_failed = Signal(str)
+    BATCH = 500
+
+    def __init__(self, path, known_paths=()):
+        super().__init__()
+        self.path = path
+        self.known_paths = known_paths
+        self.cancelled = False
+
+    def run(self):
+        count = bad = 0
+        batch, issues = [], []
+        try:
+            for task in iter_json_array(self.path):
+                if self.cancelled: return
+                problems = validate_task(task, self.known_paths)
+                if not isinstance(task, dict): task = {"type": 1.0, "value": ""}
+                batch.append(task)
+                issues.append("; ".join(problems))
+                count += 1
+                if problems: bad += 1
+                if len(batch) >= self.BATCH:
+                    self.rows_loaded.emit(batch, issues)
+                    batch, issues = [], []
+            if batch: self.rows_loaded.emit(batch, issues)
+            self.load_done.emit(count, bad)
+        except (OSError, ValueError) as e:
+            if batch: self.rows_loaded.emit(batch, issues)
+            self.load_failed.emit(str(e))
+
+# --------------------------
+# 耗时统计面板
+# --------------------------
+class MetricsPanel(QWidget):
+    COLUMNS = ["步骤", "阶段", "次数", "平均(ms)", "p50(ms)", "p95(ms)", "p99(ms)", "最大(ms)"]
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+        self.setWindowTitle("耗时统计")
+        self.resize(720, 480)
+        layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        btn_bar = QHBoxLayout()
+        refresh_btn = QPushButton("刷新"); refresh_btn.clicked.connect(self.refresh)
+        btn_bar.addWidget(refresh_btn)
+        export_btn = QPushButton("导出"); export_btn.clicked.connect(self.export)
+        btn_bar.addWidget(export_btn)
+        btn_bar.addStretch()
+        layout.addLayout(btn_bar)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        if not self.isVisible() and self.table.rowCount(): return
+        rows = []
+        for task, phases in self.engine.metrics.snapshot().items():
+            for phase, st in phases.items():
+                rows.append([task, phase, str(st["count"])] + [f"{st[k] * 1000:.2f}" for k in ("mean", "p50", "p95", "p99", "max")])
+        self.table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            for c, text in enumerate(row):
+                self.table.setItem(r, c, QTableWidgetItem(text))
+
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出耗时统计", filter="JSON (*.json)")
+        if path: self.engine.metrics.export(path)
 
 class WorkerThread(QThread):
     log_signal = Signal(str)
     finished_signal = Signal()
-    def __init__(self, engine, tasks, loop_forever):
+    def __init__(self, engine, tasks, loop_forever, resume=False):
         super().__init__()
         self.engine = engine
         self.tasks = tasks
         self.loop_forever = loop_forever
+        self.resume = resume
         self.watchdog = None 
+        self.log_batcher = LogBatcher()
+        self.flush_stop = threading.Event()
 
     def run(self):
         self.watchdog = FailsafeWatchdog(self.engine)
         self.watchdog.start()
-        self.engine.run_tasks(self.tasks, self.loop_forever, self.log_callback)
-        if self.watchdog: self.watchdog.kill()
-        self.finished_signal.emit()
+        self.flush_stop.clear()
+        flusher = threading.Thread(target=self.flush_loop, daemon=True)
+        flusher.start()
+        try:
+            self.engine.run_tasks(self.tasks, self.loop_forever, self.log_callback, self.resume)
+        finally:
+            if self.watchdog: self.watchdog.kill()
+            self.flush_stop.set()
+            flusher.join()
+            self.flush_logs()
+            self.finished_signal.emit()
+
+    def flush_loop(self):
+        # 按固定节奏把合并后的日志一次性推给界面，避免刷爆事件队列
+        interval = GLOBAL_CONFIG["log_flush_ms"] / 1000.0
+        while not self.flush_stop.wait(interval):
+            self.flush_logs()
+
+    def flush_logs(self):
+        block = self.log_batcher.drain()
+        if block: self.log_signal.emit(block)
 
     def log_callback(self, msg): 
         if GLOBAL_CONFIG["log_to_ui"]:
-            self.log_signal.emit(msg)
+            self.log_batcher.push(msg)
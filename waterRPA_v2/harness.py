@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+from .sessions import generate_session, load_session
+from .bench import summarize, time_call, hit_in_box, make_engine, collect_meta
+
+# ---------------------------------------------------------
+# 识别准确率 + 速度回归测试
+# 在带标注的录制会话上回放匹配流程, 按 引擎模式 x 相似度 统计
+# precision / recall 与耗时, 用数据决定某项提速是否可以接受
+#   python -m waterRPA_v2.harness --session rec_dir --out acc.json
+#   python -m waterRPA_v2.harness --synthetic 1080p --baseline acc.json
+# ---------------------------------------------------------
+
+# 引擎模式: 覆盖到 RPAEngine 上的参数
+MODES = {
+    "gray": {"min_scale": 1.0, "max_scale": 1.0},
+    "scaled": {"min_scale": 0.8, "max_scale": 1.2, "scale_calibration": False},
+    "wide": {"min_scale": 0.5, "max_scale": 2.0, "scale_calibration": False},
+    "fallback": {"opencv_available": False, "min_scale": 1.0, "max_scale": 1.0},
+    "noprobe": {"min_scale": 1.0, "max_scale": 1.0, "probe_filter": False},
+    # 像素探针预筛, 准确率应与 noprobe 一致
+    "probe": {"min_scale": 1.0, "max_scale": 1.0, "probe_filter": True},
+    # 缩放校准: 合成会话每帧缩放随机, 召回率会低于 wide, 用来观察收窄扫描的代价
+    "calib": {"min_scale": 0.5, "max_scale": 2.0},
+}
+
+def evaluate(sess, mode, confidence):
+    params = dict(MODES[mode], confidence=confidence)
+    tp = fp = fn = tn = 0
+    samples = []
+    for tpl_name, tpl_path in sess["templates"].items():
+        eng = make_engine([fr["image"] for fr in sess["frames"]], **params)
+        eng.load_and_precompute([{"type": 1.0, "value": tpl_path}])
+        for fr in sess["frames"]:
+            s, loc = time_call(lambda: eng.find_target_optimized(tpl_path), 1)
+            samples += s
+            box = fr["targets"].get(tpl_name)
+            if box is None:
+                if loc is None: tn += 1
+                else: fp += 1
+            elif loc is None: fn += 1
+            elif hit_in_box(loc, box): tp += 1
+            else:
+                # 找错位置: 既是误报也是漏报
+                fp += 1
+                fn += 1
+            eng.capture_backend.advance()
+    return dict(summarize(samples), tp=tp, fp=fp, fn=fn, tn=tn,
+                precision=tp / (tp + fp) if tp + fp else 1.0,
+                recall=tp / (tp + fn) if tp + fn else 1.0)
+
+def compare(results, baseline, tolerance, acc_drop):
+    problems = []
+    for key, cur in results.items():
+        base = baseline.get("results", {}).get(key)
+        if not base: continue
+        if cur["precision"] < base["precision"] - acc_drop:
+            problems.append(f"{key}: precision {base['precision']:.3f} -> {cur['precision']:.3f}")
+        if cur["recall"] < base["recall"] - acc_drop:
+            problems.append(f"{key}: recall {base['recall']:.3f} -> {cur['recall']:.3f}")
+        if base["p50_ms"] > 0 and cur["p50_ms"] > base["p50_ms"] * (1.0 + tolerance):
+            problems.append(f"{key}: p50 {base['p50_ms']:.2f}ms -> {cur['p50_ms']:.2f}ms")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="waterRPA 识别准确率/速度回归")
+    parser.add_argument("--session", action="append", default=[], help="带标注的录制会话目录 (可多次指定)")
+    parser.add_argument("--synthetic", help="额外生成一个合成会话, 如 1080p")
+    parser.add_argument("--modes", default="gray,scaled,wide", help=f"引擎模式, 可选: {','.join(MODES)}")
+    parser.add_argument("--conf", default="0.7,0.8,0.9", help="相似度列表")
+    parser.add_argument("--out", help="结果 JSON 输出路径")
+    parser.add_argument("--baseline", help="基线 JSON, 准确率下降或变慢时返回 1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的 p50 变慢比例")
+    parser.add_argument("--acc-drop", type=float, default=0.0, help="允许的 precision/recall 下降")
+    args = parser.parse_args(argv)
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    for m in modes:
+        if m not in MODES:
+            print(f"未知模式: {m}", file=sys.stderr)
+            return 2
+    confs = [float(c) for c in args.conf.split(",") if c.strip()]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        sessions = [(os.path.basename(os.path.normpath(d)), load_session(d)) for d in args.session]
+        if args.synthetic:
+            sessions.append((f"synthetic-{args.synthetic}",
+                             generate_session(work_dir, args.synthetic, n_frames=6, n_templates=4,
+                                              scales=(0.9, 1.0, 1.1), absent_ratio=0.3, seed=7,
+                                              shifts=(0, 0, 45))))
+        if not sessions:
+            print("需要 --session 或 --synthetic", file=sys.stderr)
+            return 2
+        for name, sess in sessions:
+            for mode in modes:
+                for conf in confs:
+                    results[f"{name}/{mode}@{conf:g}"] = evaluate(sess, mode, conf)
+
+    print(f"{'会话/模式@相似度':<32}{'precision':>10}{'recall':>8}{'p50(ms)':>10}{'p95(ms)':>10}")
+    for key, r in results.items():
+        print(f"{key:<38}{r['precision']:>10.3f}{r['recall']:>8.3f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": collect_meta(), "results": results}, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f: baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance, args.acc_drop)
+        for p in problems: print(f"!!! 回归 {p}")
+        if problems: return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+
+from .config import TASK_TYPES, IMAGE_TASK_TYPES, COLOR_TASK_TYPES
+
+# ---------------------------------------------------------
+# 任务脚本流式读取 + 逐条校验
+# 问题在导入时就暴露出来, 而不是运行到那一步才失败
+# ---------------------------------------------------------
+
+def iter_json_array(path, chunk_size=65536):
+    # 逐个产出顶层 JSON 数组里的元素, 不需要一次读入整个文件
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk_size)
+        eof = len(buf) < chunk_size
+        pos = 0
+        started = False
+        while True:
+            # 跳过空白、开头的 [ 与元素间的逗号
+            while pos < len(buf) and (buf[pos] in " \t\r\n," or (not started and buf[pos] in "﻿[")):
+                if buf[pos] == "[": started = True
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]" and started: return
+            if pos >= len(buf):
+                if eof: raise ValueError("脚本不完整: 缺少结尾的 ]")
+                buf = buf[pos:] + f.read(chunk_size)
+                eof = len(buf) < chunk_size or eof
+                pos = 0
+                continue
+            if not started: raise ValueError("脚本应为任务列表")
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if eof: raise ValueError(f"JSON 格式错误: {e}") from e
+                more = f.read(chunk_size)
+                if not more: eof = True
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            if not eof and (end >= len(buf) or buf[end] not in " \t\r\n,]"):
+                # 数字可能在块边界被截断 ("23456" 只读到 "23"), 后面跟着分隔符才算完整
+                more = f.read(chunk_size)
+                if not more: eof = True
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            yield item
+            pos = end
+            if pos > chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+_key_names = None
+
+def _known_keys():
+    global _key_names
+    if _key_names is None:
+        try:
+            from .backends import get_pyautogui
+            _key_names = set(get_pyautogui().KEYBOARD_KEYS)
+        except Exception:
+            _key_names = set()  # 拿不到键名表时不校验键名
+    return _key_names
+
+def validate_task(task, known_paths=()):
+    # 返回问题描述列表, 空列表表示没问题
+    if not isinstance(task, dict): return ["不是有效的指令"]
+    issues = []
+    cmd = task.get("type")
+    val = task.get("value", "")
+    if cmd not in TASK_TYPES:
+        return [f"未知指令类型: {cmd}"]
+
+    if cmd in IMAGE_TASK_TYPES:
+        path = str(val)
+        if not path: issues.append("未选择图片")
+        elif path not in known_paths:
+            if not os.path.exists(path): issues.append(f"图片不存在: {path}")
+            else:
+                try:
+                    from PIL import Image
+                    with Image.open(path) as img: img.size  # 只读文件头
+                except Exception: issues.append(f"图片无法读取: {path}")
+    elif cmd == 5.0:
+        try:
+            if float(val) < 0: issues.append("等待时间不能为负数")
+        except (TypeError, ValueError): issues.append(f"等待时间不是数字: {val}")
+    elif cmd == 6.0:
+        try: int(val)
+        except (TypeError, ValueError): issues.append(f"滚动量不是整数: {val}")
+    elif cmd == 7.0:
+        keys = [k.strip() for k in str(val).lower().split('+')]
+        if not all(keys): issues.append(f"按键格式错误: {val}")
+        else:
+            known = _known_keys()
+            bad = [k for k in keys if known and k not in known]
+            if bad: issues.append(f"未知按键: {', '.join(bad)}")
+    elif cmd == 9.0:
+        path = str(val)
+        folder = path if os.path.isdir(path) else os.path.dirname(path)
+        if not path: issues.append("未填写截图保存路径")
+        elif folder and not os.path.isdir(folder): issues.append(f"截图目录不存在: {folder}")
+    elif cmd in COLOR_TASK_TYPES:
+        from .vision import parse_color_spec
+        try:
+            _, goto, other = parse_color_spec(val)
+            if cmd == 11.0 and goto is None and other is None: issues.append("颜色跳转缺少 -> 步骤号")
+        except ValueError as e: issues.append(str(e))
+
+    if "retry" in task:
+        try: int(task["retry"])
+        except (TypeError, ValueError): issues.append(f"retry 不是整数: {task['retry']}")
+    if "scale" in task:
+        try: ok = float(task["scale"]) > 0
+        except (TypeError, ValueError): ok = False
+        if not ok: issues.append(f"scale 取值无效: {task['scale']}")
+    for key in ("latency", "cpu"):
+        if key not in task: continue
+        try: ok = float(task[key]) > 0 and (key != "cpu" or float(task[key]) <= 1)
+        except (TypeError, ValueError): ok = False
+        if not ok: issues.append(f"{key} 取值无效: {task[key]}")
+    return issues
+
+def validate_tasks(tasks, known_paths=()):
+    problems = []
+    for idx, task in enumerate(tasks):
+        issues = validate_task(task, known_paths)
+        for msg in issues:
+            problems.append((idx, msg))
+        if not issues and isinstance(task, dict) and task.get("type") in COLOR_TASK_TYPES:
+            from .vision import parse_color_spec
+            _, goto, other = parse_color_spec(task.get("value", ""))
+            for target in (goto, other):
+                if target is not None and target > len(tasks):
+                    problems.append((idx, f"跳转目标超出范围: 第 {target} 步 (共 {len(tasks)} 步)"))
+    return problems
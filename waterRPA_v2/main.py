@@ -1,25 +1,46 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
-import ctypes
+import time
+import threading
 from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QObject, QEvent, QTimer, QMetaObject, Qt
 
 # No system path hacking needed if run via run.py as module
 
 from .gui.main_window import RPAWindow
-from .utils import global_exception_handler
+from .utils import global_exception_handler, enable_dpi_awareness
 
 # ---------------------------------------------------------
 # Core setup
 # ---------------------------------------------------------
 def setup_env():
-    try:
-        os.environ["QT_ENABLE_HIGHDPI_SCALING"] = "0"
-        os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "1"
-        ctypes.windll.shcore.SetProcessDpiAwareness(1) 
-    except:
-        try: ctypes.windll.user32.SetProcessDPIAware()
-        except: pass
+    os.environ["QT_ENABLE_HIGHDPI_SCALING"] = "0"
+    os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "1"
+    enable_dpi_awareness()
+
+# ---------------------------------------------------------
+# 启动耗时探针 (RPA_STARTUP_PROBE=1 时启用, 供 bench --startup 使用)
+# 打印首帧绘制与引擎预热完成的时间戳后退出
+# ---------------------------------------------------------
+class StartupProbe(QObject):
+    def __init__(self, app, win):
+        super().__init__()
+        self.app = app
+        self.win = win
+        self.painted = False
+
+    def eventFilter(self, obj, event):
+        if not self.painted and event.type() == QEvent.Paint:
+            self.painted = True
+            print(f"first_paint {time.time():.6f}", flush=True)
+            threading.Thread(target=self.wait_ready, daemon=True).start()
+        return False
+
+    def wait_ready(self):
+        self.win.engine.warmup_done.wait(60)
+        print(f"engine_ready {time.time():.6f}", flush=True)
+        QMetaObject.invokeMethod(self.app, "quit", Qt.QueuedConnection)
 
 def main():
     setup_env()
@@ -27,7 +48,12 @@ def main():
     
     app = QApplication(sys.argv)
     win = RPAWindow()
+    if os.environ.get("RPA_STARTUP_PROBE"):
+        probe = StartupProbe(app, win)
+        app.installEventFilter(probe)
     win.show()
+    # 窗口已显示后再在后台导入 cv2/numpy/pyautogui
+    QTimer.singleShot(0, win.engine.start_warmup)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import math
+import json
+import threading
+
+# --------------------------
+# 耗时直方图 (对数分桶, 内存固定)
+# --------------------------
+class Histogram:
+    MIN_VALUE = 1e-5   # 10us
+    RATIO = 1.1        # 相邻桶 10% 精度
+    NUM_BUCKETS = 200  # 覆盖到 100s 以上
+
+    def __init__(self):
+        self.buckets = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds < self.MIN_VALUE: idx = 0
+        else: idx = min(int(math.log(seconds / self.MIN_VALUE) / math.log(self.RATIO)) + 1, self.NUM_BUCKETS - 1)
+        self.buckets[idx] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+
+    def percentile(self, p):
+        if self.count == 0: return 0.0
+        target = self.count * p / 100.0
+        seen = 0
+        for idx, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                if idx == 0: return min(self.MIN_VALUE, self.max)
+                # 取桶的几何中点, 不超过实际最大值
+                lo = self.MIN_VALUE * self.RATIO ** (idx - 1)
+                return min(lo * math.sqrt(self.RATIO), self.max)
+        return self.max
+
+    def merge(self, other):
+        for idx, n in enumerate(other.buckets): self.buckets[idx] += n
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max: self.max = other.max
+
+    def to_raw(self):
+        # 只保存非空桶, 便于跨进程传输后合并
+        return {"buckets": {str(i): n for i, n in enumerate(self.buckets) if n},
+                "count": self.count, "total": self.total, "max": self.max}
+
+    @classmethod
+    def from_raw(cls, raw):
+        h = cls()
+        for i, n in raw["buckets"].items(): h.buckets[int(i)] = n
+        h.count, h.total, h.max = raw["count"], raw["total"], raw["max"]
+        return h
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+# --------------------------
+# 分步骤/分阶段耗时统计
+# --------------------------
+class MetricsRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hists = {}   # task -> {phase: Histogram}
+        self.order = []   # 步骤出现顺序
+
+    def reset(self):
+        with self.lock:
+            self.hists = {}
+            self.order = []
+
+    def record(self, task, phase, seconds):
+        with self.lock:
+            phases = self.hists.get(task)
+            if phases is None:
+                phases = self.hists[task] = {}
+                self.order.append(task)
+            hist = phases.get(phase)
+            if hist is None: hist = phases[phase] = Histogram()
+            hist.add(seconds)
+
+    def merge_raw(self, raw, prefix=""):
+        # raw: 另一个 MetricsRecorder.dump() 的结果
+        other = {task: {phase: Histogram.from_raw(r) for phase, r in phases.items()} for task, phases in raw.items()}
+        with self.lock:
+            for task, phases in other.items():
+                key = prefix + task
+                dst = self.hists.get(key)
+                if dst is None:
+                    dst = self.hists[key] = {}
+                    self.order.append(key)
+                for phase, h in phases.items():
+                    if phase in dst: dst[phase].merge(h)
+                    else: dst[phase] = h
+
+    def dump(self):
+        with self.lock:
+            return {task: {phase: h.to_raw() for phase, h in self.hists[task].items()} for task in self.order}
+
+    def snapshot(self):
+        with self.lock:
+            return {task: {phase: h.summary() for phase, h in self.hists[task].items()} for task in self.order}
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import shutil
+import threading
+import collections
+
+from .utils import write_log
+
+# ---------------------------------------------------------
+# 飞行记录仪: 内存里保留最近 N 帧找图画面 (灰度 JPEG) + 每帧的找图结果与耗时
+# 平时只在找图线程里把画面引用放进队列, 压缩在后台线程做;
+# 步骤超时 / 看门狗急停 / 引擎异常时才写盘 (同样在后台线程), 格式同 sessions.py 的会话目录:
+#   manifest.json + frames/*.png + templates/* + flight.json (触发原因/统计/参数)
+# ---------------------------------------------------------
+PENDING_MAX = 4  # 来不及压缩的帧最多排这么多, 再多丢最旧的
+
+class FlightRecorder:
+    def __init__(self, capacity=60, quality=80):
+        self.capacity = capacity
+        self.quality = quality
+        self.frames = collections.deque(maxlen=capacity)  # (JPEG 字节, 元数据)
+        self.pending = collections.deque(maxlen=PENDING_MAX)
+        self.cond = threading.Condition()
+        self.busy = None   # 正在压缩的 (gray, meta)
+        self.gen = 0       # 每取走一次快照加 1, 压缩中途被取走的帧不再放回
+        self.dropped = 0
+        self.writers = []  # 正在写盘的线程
+        self.closed = False
+        threading.Thread(target=self._work, name="flight-recorder", daemon=True).start()
+
+    def add(self, gray, meta):
+        # gray 不会再被修改, 这里只保存引用
+        with self.cond:
+            if len(self.pending) == self.pending.maxlen: self.dropped += 1
+            self.pending.append((gray, meta))
+            self.cond.notify()
+
+    def _work(self):
+        import cv2
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed: self.cond.wait()
+                if self.closed: return
+                gray, meta = self.busy = self.pending.popleft()
+                gen = self.gen
+            try:
+                ok, buf = cv2.imencode(".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if ok:
+                    with self.cond:
+                        if gen == self.gen: self.frames.append((buf.tobytes(), meta))
+            except Exception as e: write_log(f"飞行记录压缩失败: {e}")
+            finally:
+                with self.cond:
+                    self.busy = None
+                    self.cond.notify_all()
+
+    def drain(self, timeout=2.0):
+        # 等后台把排队的帧压完
+        deadline = time.time() + timeout
+        with self.cond:
+            while (self.pending or self.busy is not None) and time.time() < deadline:
+                self.cond.wait(0.05)
+
+    def close(self):
+        # 停掉压缩线程; 已经开始的写盘照常完成
+        with self.cond:
+            self.closed = True
+            self.pending.clear()
+            self.cond.notify_all()
+
+    def clear(self):
+        with self.cond:
+            self.frames.clear()
+            self.pending.clear()
+            self.gen += 1
+
+    def __len__(self):
+        return len(self.frames)
+
+    def snapshot(self):
+        # 取走当前记录 (已压缩的 + 还在排队的), 只拷贝引用
+        with self.cond:
+            frames = list(self.frames)
+            pending = ([self.busy] if self.busy is not None else []) + list(self.pending)
+            self.frames.clear()
+            self.pending.clear()
+            self.gen += 1
+            dropped, self.dropped = self.dropped, 0
+        return frames, pending, dropped
+
+    def dump_async(self, out_dir, reason, templates=(), info=None, on_done=None):
+        # 引擎线程只取快照, 解码/写 PNG 在后台; on_done(帧数) 写完后调用
+        snap = self.snapshot()
+        def work():
+            try:
+                n = self.dump(out_dir, reason, templates, info, snap)
+                if on_done: on_done(n)
+            except Exception as e: write_log(f"飞行记录写出失败: {out_dir} ({e})")
+        t = threading.Thread(target=work, name="flight-dump", daemon=True)
+        self.writers = [w for w in self.writers if w.is_alive()] + [t]
+        t.start()
+
+    def wait(self, timeout=10.0):
+        # 等后台写盘结束, 超时返回 False
+        deadline = time.time() + timeout
+        for t in self.writers: t.join(max(deadline - time.time(), 0))
+        self.writers = [w for w in self.writers if w.is_alive()]
+        return not self.writers
+
+    def dump(self, out_dir, reason, templates=(), info=None, snap=None):
+        # 写出会话目录, 返回帧数; snap 为空时当场取快照
+        import cv2
+        import numpy as np
+        from PIL import Image
+        from .sessions import save_session
+        if snap is None:
+            self.drain()
+            snap = self.snapshot()
+        encoded, pending, dropped = snap
+        frames = [(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE), meta) for data, meta in encoded]
+        frames += pending
+        os.makedirs(out_dir, exist_ok=True)
+
+        tpl_dir = os.path.join(out_dir, "templates")
+        names, files = {}, {}
+        for path in templates:
+            name, ext = os.path.splitext(os.path.basename(path))
+            while name in names.values(): name += "_"  # 不同目录下的同名模板
+            dst = os.path.join(tpl_dir, name + ext)
+            try:
+                os.makedirs(tpl_dir, exist_ok=True)
+                shutil.copyfile(path, dst)
+                names[path], files[name] = name, dst
+            except OSError: pass  # 脚本包里的模板没有原文件
+
+        session = {"resolution": None, "templates": files, "frames": []}
+        for gray, meta in frames:
+            if session["resolution"] is None: session["resolution"] = [gray.shape[1], gray.shape[0]]
+            results = [dict(r, template=names.get(r["template"], r["template"])) for r in meta.get("results", [])]
+            session["frames"].append({"image": Image.fromarray(gray), "targets": {},
+                                      "results": results, "timings": meta.get("timings", {})})
+        save_session(session, out_dir)
+        with open(os.path.join(out_dir, "flight.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(info or {}, reason=reason, frames=len(frames), dropped=dropped,
+                           time=time.strftime("%Y-%m-%d %H:%M:%S")), f, ensure_ascii=False, indent=2)
+        return len(frames)
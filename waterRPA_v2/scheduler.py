@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import time
+
+# ---------------------------------------------------------
+# 自适应轮询: 找图重试的间隔随情况变化
+#   画面有变化 / 刚命中   -> 立刻回到最快节奏
+#   画面静止 / 目标久未出现 -> 间隔逐步放大, 上限为延迟预算
+#   CPU 预算: 找图耗时占 (找图 + 等待) 的比例不超过 cpu_budget
+# ---------------------------------------------------------
+
+class AdaptivePoller:
+    MIN_INTERVAL = 0.001
+    BACKOFF = 1.5
+    ABSENT_AFTER = 1.0  # 目标连续缺席超过该秒数, 即使画面在变也开始放慢
+
+    def __init__(self, latency_budget=0.2, cpu_budget=0.5):
+        self.latency_budget = max(latency_budget, self.MIN_INTERVAL)
+        self.cpu_budget = min(max(cpu_budget, 0.01), 1.0)
+        self.interval = self.MIN_INTERVAL
+        self.started = time.perf_counter()
+        self.last_seen = self.started
+        self.polls = 0
+        self.waited = 0.0
+
+    def next_delay(self, work, changed, found):
+        # work: 本次找图耗时; 返回下次找图前应等待的秒数
+        self.polls += 1
+        now = time.perf_counter()
+        if found: self.last_seen = now
+        if found or (changed and now - self.last_seen < self.ABSENT_AFTER):
+            self.interval = self.MIN_INTERVAL
+        else:
+            self.interval = min(self.interval * self.BACKOFF + self.MIN_INTERVAL, self.latency_budget)
+        # 找图本身很慢时按 CPU 预算补足等待
+        # 两个预算冲突时延迟预算优先
+        cpu_floor = work * (1.0 - self.cpu_budget) / self.cpu_budget
+        return min(max(self.interval, cpu_floor), self.latency_budget)
+
+    def wait(self, delay, stop_check=None):
+        # 分片睡眠, 急停时及时返回
+        end = time.perf_counter() + delay
+        while True:
+            left = end - time.perf_counter()
+            if left <= 0 or (stop_check and stop_check()): break
+            time.sleep(min(left, 0.05))
+        self.waited += delay
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def rate(self):
+        # 实际找图频率 (次/秒)
+        elapsed = self.elapsed()
+        return self.polls / elapsed if elapsed > 0 else 0.0
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+
+# ---------------------------------------------------------
+# 录制/合成画面会话
+# 目录结构:
+#   manifest.json   {"resolution": [w, h], "templates": {名称: 相对路径},
+#                    "frames": [{"file": 相对路径, "targets": {名称: [x, y, w, h] 或 null}}]}
+#   templates/*.png
+#   frames/*.png
+# ---------------------------------------------------------
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+
+def make_background(w, h, rng):
+    import cv2
+    import numpy as np
+    # 低频色块 + 少量噪声, 近似普通界面
+    coarse = rng.integers(0, 256, (max(h // 40, 2), max(w // 40, 2), 3), dtype=np.uint8)
+    bg = cv2.resize(coarse, (w, h), interpolation=cv2.INTER_LINEAR)
+    noise = rng.integers(-8, 9, (h, w, 3))
+    return np.clip(bg.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+def make_icon(w, h, rng):
+    import cv2
+    import numpy as np
+    icon = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    icon = cv2.GaussianBlur(icon, (3, 3), 0)
+    cv2.rectangle(icon, (0, 0), (w - 1, h - 1), tuple(int(c) for c in rng.integers(0, 256, 3)), 2)
+    return icon
+
+def generate_session(out_dir, resolution="1080p", n_frames=4, n_templates=3, icon_size=(48, 48),
+                     scales=(1.0,), absent_ratio=0.25, seed=0, shifts=(0,)):
+    # 生成带已知目标位置的合成帧; 模板写入 out_dir/templates, 帧保存在内存中
+    # shifts: 每个目标随机取一个亮度偏移, 模拟悬停高亮/变暗
+    import cv2
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    w, h = RESOLUTIONS.get(resolution, resolution)
+    tpl_dir = os.path.join(out_dir, "templates")
+    os.makedirs(tpl_dir, exist_ok=True)
+
+    icons = {}
+    templates = {}
+    for i in range(n_templates):
+        name = f"icon{i}"
+        icons[name] = make_icon(icon_size[0], icon_size[1], rng)
+        templates[name] = os.path.join(tpl_dir, f"{name}.png")
+        Image.fromarray(icons[name]).save(templates[name])
+
+    frames = []
+    for f_idx in range(n_frames):
+        frame = make_background(w, h, rng)
+        targets = {}
+        for name, icon in icons.items():
+            if rng.random() < absent_ratio:
+                targets[name] = None
+                continue
+            scale = float(scales[int(rng.integers(0, len(scales)))])
+            tw, th = max(int(icon.shape[1] * scale), 1), max(int(icon.shape[0] * scale), 1)
+            placed = cv2.resize(icon, (tw, th)) if (tw, th) != icon.shape[1::-1] else icon
+            shift = int(shifts[int(rng.integers(0, len(shifts)))])
+            if shift: placed = np.clip(placed.astype(np.int16) + shift, 0, 255).astype(np.uint8)
+            # 避免目标之间重叠
+            for _ in range(50):
+                x, y = int(rng.integers(0, w - tw)), int(rng.integers(0, h - th))
+                if all(b is None or x + tw < b[0] or b[0] + b[2] < x or y + th < b[1] or b[1] + b[3] < y
+                       for b in targets.values()):
+                    break
+            frame[y:y + th, x:x + tw] = placed
+            targets[name] = [x, y, tw, th]
+        frames.append({"image": Image.fromarray(frame), "targets": targets})
+
+    return {"resolution": [w, h], "templates": templates, "frames": frames}
+
+def save_session(session, out_dir):
+    frame_dir = os.path.join(out_dir, "frames")
+    os.makedirs(frame_dir, exist_ok=True)
+    manifest = {
+        "resolution": session["resolution"],
+        "templates": {k: os.path.relpath(v, out_dir) for k, v in session["templates"].items()},
+        "frames": [],
+    }
+    for i, fr in enumerate(session["frames"]):
+        rel = os.path.join("frames", f"{i:05d}.png")
+        fr["image"].save(os.path.join(out_dir, rel))
+        entry = {"file": rel, "targets": fr["targets"]}
+        for key in ("results", "timings"):
+            if key in fr: entry[key] = fr[key]
+        manifest["frames"].append(entry)
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+def load_session(session_dir):
+    from PIL import Image
+    with open(os.path.join(session_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    templates = {k: os.path.join(session_dir, v) for k, v in manifest.get("templates", {}).items()}
+    frames = []
+    for entry in manifest["frames"]:
+        img = Image.open(os.path.join(session_dir, entry["file"]))
+        img.load()
+        fr = dict(entry)
+        fr["image"] = img.convert("RGB")
+        fr.setdefault("targets", {})
+        frames.append(fr)
+    return {"resolution": manifest.get("resolution"), "templates": templates, "frames": frames}
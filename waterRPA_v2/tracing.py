@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import threading
+from collections import deque
+
+# --------------------------
+# Chrome trace-event 记录器
+# 生成的 json 可直接拖进 chrome://tracing 或 ui.perfetto.dev 查看
+# --------------------------
+class Tracer:
+    def __init__(self, max_events=500000):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)  # 超出上限时丢弃最早的事件
+        self.thread_names = {}
+        self.pid = os.getpid()
+        self.t_base = time.perf_counter()
+
+    def start(self):
+        self.events.clear()
+        self.thread_names = {}
+        self.t_base = time.perf_counter()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def _tid(self):
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        return tid
+
+    def complete(self, name, cat, t0, t1, args=None):
+        if not self.enabled: return
+        ev = {"name": name, "cat": cat, "ph": "X", "pid": self.pid, "tid": self._tid(),
+              "ts": (t0 - self.t_base) * 1e6, "dur": (t1 - t0) * 1e6}
+        if args: ev["args"] = args
+        self.events.append(ev)
+
+    def instant(self, name, cat, args=None):
+        if not self.enabled: return
+        ev = {"name": name, "cat": cat, "ph": "i", "s": "t", "pid": self.pid, "tid": self._tid(),
+              "ts": (time.perf_counter() - self.t_base) * 1e6}
+        if args: ev["args"] = args
+        self.events.append(ev)
+
+    def write(self, path):
+        meta = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                for tid, name in list(self.thread_names.items())]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": meta + list(self.events), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
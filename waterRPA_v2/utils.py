@@ -3,6 +3,7 @@ import sys
 import os
 import time
 import traceback
+import threading
 from .config import GLOBAL_CONFIG
 
 def get_base_dir():
@@ -31,6 +32,10 @@ def get_log_path():
     else:
         return os.path.join(project_root, "rpa_debug_log.txt")
 
+def get_output_path(filename):
+    # 统计/追踪等输出文件与日志放在同一目录
+    return os.path.join(os.path.dirname(get_log_path()), filename)
+
 def write_log(msg):
     timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
     formatted_msg = f"[{timestamp}] {msg}"
@@ -40,7 +45,70 @@ def write_log(msg):
                 f.write(formatted_msg + "\n")
         except: pass
 
+# --------------------------
+# 高分屏 (DPI)
+# --------------------------
+def enable_dpi_awareness():
+    # 声明 DPI 感知, 截图/鼠标坐标都按物理像素; 非 Windows 上什么也不做
+    try:
+        import ctypes
+        ctypes.windll.shcore.SetProcessDpiAwareness(1)
+    except:
+        try: ctypes.windll.user32.SetProcessDPIAware()
+        except: pass
+
+def detect_dpi_scale():
+    # 系统缩放比例 (150% -> 1.5), 需先 enable_dpi_awareness, 取不到时返回 1.0
+    try:
+        import ctypes
+        return ctypes.windll.user32.GetDpiForSystem() / 96.0
+    except:
+        try:
+            import ctypes
+            hdc = ctypes.windll.user32.GetDC(0)
+            dpi = ctypes.windll.gdi32.GetDeviceCaps(hdc, 88)  # LOGPIXELSX
+            ctypes.windll.user32.ReleaseDC(0, hdc)
+            return dpi / 96.0
+        except: return 1.0
+
+def physical_scale(logical_w, logical_h):
+    # 物理像素 / 界面逻辑像素, 界面坐标换算成截图坐标时使用
+    from .backends import get_pyautogui
+    phys_w, phys_h = get_pyautogui().size()
+    return phys_w / logical_w, phys_h / logical_h
+
 def global_exception_handler(exctype, value, tb):
     err_msg = "".join(traceback.format_exception(exctype, value, tb))
     write_log(f"!!! 严重崩溃 !!! {value}\n{err_msg}")
     sys.__excepthook__(exctype, value, tb)
+
+# --------------------------
+# 界面日志合并缓冲
+# --------------------------
+class LogBatcher:
+    def __init__(self, max_pending=None):
+        self.lock = threading.Lock()
+        self.pending = []  # [msg, count]
+        self.dropped = 0
+        self.max_pending = max_pending or GLOBAL_CONFIG["log_max_pending"]
+
+    def push(self, msg):
+        with self.lock:
+            if self.pending and self.pending[-1][0] == msg:
+                self.pending[-1][1] += 1
+                return
+            if len(self.pending) >= self.max_pending:
+                # 超出上限时丢弃最旧的行，只保留计数
+                self.dropped += self.pending.pop(0)[1]
+            self.pending.append([msg, 1])
+
+    def drain(self):
+        with self.lock:
+            if not self.pending and not self.dropped: return None
+            pending, dropped = self.pending, self.dropped
+            self.pending, self.dropped = [], 0
+        lines = []
+        if dropped: lines.append(f"... 省略 {dropped} 条日志 ...")
+        for msg, count in pending:
+            lines.append(msg if count == 1 else f"{msg} (x{count})")
+        return "\n".join(lines)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+# ---------------------------------------------------------
+# 画面辅助: 变化检测等与具体模板无关的图像工具
+# 都在灰度 ndarray 上工作, 调用方负责截图和转灰度
+# ---------------------------------------------------------
+
+THUMB_STEP = 8          # 缩略图采样间隔 (像素)
+CHANGE_BLOCK = 4        # 缩略图按 4x4 分块比较, 步长 8 时一块对应屏幕 32x32
+CHANGE_THRESHOLD = 6.0  # 任一块的平均灰度差超过该值视为画面变化
+
+def frame_thumb(gray, step=THUMB_STEP):
+    # 隔行隔列采样, 1080p 约 3 万像素, 比较一次不到 0.1ms
+    return gray[::step, ::step].astype("int16")
+
+def thumb_changed(prev, cur, threshold=CHANGE_THRESHOLD, block=CHANGE_BLOCK):
+    # 取最大的分块差而不是整帧平均: 整帧里出现一个图标, 平均差几乎不动
+    if prev is None or cur is None or prev.shape != cur.shape: return True
+    import numpy as np
+    diff = np.abs(cur - prev)
+    h, w = diff.shape[:2]
+    bh, bw = -(-h // block), -(-w // block)
+    padded = np.zeros((bh * block, bw * block), diff.dtype)
+    padded[:h, :w] = diff if diff.ndim == 2 else diff.max(axis=2)
+    return float(padded.reshape(bh, block, bw, block).mean(axis=(1, 3)).max()) > threshold
+
+# ---------------------------------------------------------
+# 模板库: 同尺寸模板分组匹配
+# TM_CCOEFF_NORMED = (sum(T*I) - mean(T)*sum(I)) / (|T'| * std(I 窗口) * sqrt(n))
+# 窗口的 sum(I) 与方差只和模板尺寸有关, 每帧每种尺寸算一次;
+# 每个模板只需一次 TM_CCORR, 再做两次逐元素运算即可得到归一化得分
+# 最佳位置最后用原生 TM_CCOEFF_NORMED 在模板大小的小块上复核得分
+# ---------------------------------------------------------
+class TemplateBank:
+    def __init__(self):
+        self.groups = {}  # (h, w) -> {key: (模板, 均值, 去均值后的范数)}
+
+    def __len__(self):
+        return sum(len(g) for g in self.groups.values())
+
+    def __contains__(self, key):
+        return any(key in g for g in self.groups.values())
+
+    def add(self, key, tpl):
+        import numpy as np
+        t = np.ascontiguousarray(tpl, dtype=np.uint8)
+        mean = float(t.mean())
+        norm = float(np.sqrt(((t - mean) ** 2).sum()))
+        self.discard(key)
+        self.groups.setdefault(t.shape[:2], {})[key] = (t, mean, norm)
+
+    def discard(self, key):
+        for shape in list(self.groups):
+            g = self.groups[shape]
+            if g.pop(key, None) is not None and not g: del self.groups[shape]
+
+    def clear(self):
+        self.groups = {}
+
+    @staticmethod
+    def window_stats(gray, h, w):
+        # 返回 (窗口和 / 窗口标准差, 1 / 窗口标准差), 形状同 matchTemplate 结果
+        import cv2
+        H, W = gray.shape[:2]
+        s = cv2.boxFilter(gray, cv2.CV_32F, (w, h), anchor=(0, 0), normalize=False,
+                          borderType=cv2.BORDER_CONSTANT)[:H - h + 1, :W - w + 1]
+        q = cv2.sqrBoxFilter(gray, cv2.CV_32F, (w, h), anchor=(0, 0), normalize=False,
+                             borderType=cv2.BORDER_CONSTANT)[:H - h + 1, :W - w + 1]
+        var = cv2.max(cv2.scaleAdd(cv2.multiply(s, s), -1.0 / (h * w), q), 1.0)  # 纯色窗口不参与
+        inv = cv2.divide(1.0, cv2.sqrt(var))
+        return cv2.multiply(s, inv), inv
+
+    def match(self, gray, keys=None, on_group=None):
+        # 返回 {key: (得分, (中心x, 中心y))}, keys 为 None 时匹配全部
+        import cv2
+        want = set(keys) if keys is not None else None
+        H, W = gray.shape[:2]
+        out = {}
+        for (h, w), group in self.groups.items():
+            if h > H or w > W: continue
+            members = [(k, v) for k, v in group.items() if want is None or k in want]
+            if not members: continue
+            a, inv = self.window_stats(gray, h, w)
+            for key, (tpl, mean, norm) in members:
+                if norm <= 0: continue
+                corr = cv2.matchTemplate(gray, tpl, cv2.TM_CCORR)
+                score = cv2.scaleAdd(a, -mean, cv2.multiply(corr, inv))
+                _, _, _, (x, y) = cv2.minMaxLoc(score)
+                exact = float(cv2.matchTemplate(gray[y:y + h, x:x + w], tpl, cv2.TM_CCOEFF_NORMED)[0, 0])
+                out[key] = (exact, (x + w // 2, y + h // 2))
+            if on_group: on_group((h, w), len(members))
+        return out
+
+# ---------------------------------------------------------
+# 像素探针: 模板里挑十几个有代表性的像素, 完整匹配前先比对它们
+#   上次命中位置: 探针全部吻合再做一次小块复核, 直接返回
+#   整帧: 前两个探针用整帧比较筛出候选位置, 其余探针只在候选上取值, 候选复核通过即返回
+# 探针比较原始灰度, 对亮度变化敏感: 没有候选不代表目标不在, 仍要做整帧 matchTemplate
+# ---------------------------------------------------------
+PROBE_POINTS = 12
+PROBE_TOL = 32     # 单个像素允许的灰度差
+GRID_SPARSE = 4096 # 整帧候选少于该数时改为逐点检查
+
+class Probe:
+    def __init__(self, ys, xs, vals, shape):
+        self.ys, self.xs, self.vals = ys, xs, vals
+        self.shape = shape  # 模板 (h, w)
+
+def make_probe(tpl, k=PROBE_POINTS):
+    # 优先取偏离均值大、且周围 3x3 平坦的像素 (边缘像素对亚像素偏移太敏感)
+    import cv2
+    import numpy as np
+    h, w = tpl.shape[:2]
+    if h < 3 or w < 3: return None
+    kernel = np.ones((3, 3), np.uint8)
+    spread = cv2.dilate(tpl, kernel).astype(np.int16) - cv2.erode(tpl, kernel).astype(np.int16)
+    score = np.abs(tpl.astype(np.int16) - int(tpl.mean())) - 2 * spread
+    score[0, :] = score[-1, :] = score[:, 0] = score[:, -1] = -1000
+    min_dist = max(min(h, w) // 6, 2)
+    order = np.argsort(score, axis=None)[::-1]
+    picked = []
+    # 第一轮要求灰度值互相拉开, 几个探针同色时筛选力很差; 不够再放宽
+    for spread_vals in (True, False):
+        for idx in order:
+            y, x = divmod(int(idx), w)
+            if (y, x) in picked: continue
+            if any(abs(y - py) < min_dist and abs(x - px) < min_dist for py, px in picked): continue
+            if spread_vals and any(abs(int(tpl[y, x]) - int(tpl[py, px])) < PROBE_TOL for py, px in picked): continue
+            picked.append((y, x))
+            if len(picked) >= k: break
+        if len(picked) >= k: break
+    ys = np.array([p[0] for p in picked], dtype=np.intp)
+    xs = np.array([p[1] for p in picked], dtype=np.intp)
+    return Probe(ys, xs, tpl[ys, xs].astype(np.int16), (h, w))
+
+def probe_at(gray, probe, x, y, tol=PROBE_TOL):
+    import numpy as np
+    h, w = probe.shape
+    if x < 0 or y < 0 or y + h > gray.shape[0] or x + w > gray.shape[1]: return False
+    return bool(np.all(np.abs(gray[probe.ys + y, probe.xs + x].astype(np.int16) - probe.vals) <= tol))
+
+def probe_grid(gray, probe, tol=PROBE_TOL):
+    # 返回所有探针都吻合的左上角坐标 (N, 2) [x, y]; 探针区分度太低时提前放弃, 返回 None
+    import cv2
+    import numpy as np
+    h, w = probe.shape
+    H, W = gray.shape[:2]
+    if h > H or w > W: return np.empty((0, 2), np.intp)
+    # 整帧掩码逐个探针相与 (每个不到 1ms), 候选足够稀疏后改为只在候选点上取值
+    mask = None
+    used = 0
+    for i in range(len(probe.vals)):
+        dy, dx, v = int(probe.ys[i]), int(probe.xs[i]), int(probe.vals[i])
+        region = gray[dy:dy + H - h + 1, dx:dx + W - w + 1]
+        m = cv2.inRange(region, max(v - tol, 0), min(v + tol, 255))
+        mask = m if mask is None else cv2.bitwise_and(mask, m)
+        used = i + 1
+        left = cv2.countNonZero(mask)
+        if left <= GRID_SPARSE: break
+        if used >= 4 and left > GRID_SPARSE * 8: return None
+    if not left: return np.empty((0, 2), np.intp)
+    pts = cv2.findNonZero(mask).reshape(-1, 2).astype(np.intp)
+    xs, ys = pts[:, 0], pts[:, 1]
+    for i in range(used, len(probe.vals)):
+        if not len(ys): break
+        ok = np.abs(gray[ys + probe.ys[i], xs + probe.xs[i]].astype(np.int16) - probe.vals[i]) <= tol
+        ys, xs = ys[ok], xs[ok]
+    return np.stack([xs, ys], axis=1)
+
+# ---------------------------------------------------------
+# 取色条件 (指令 10.0 / 11.0): 只截条件覆盖的小块, 不做找图
+#   单点      x,y,#RRGGBB[,容差]
+#   区域均值  x,y,w,h,#RRGGBB[,容差]
+#   多个条件用 ; 分隔, 全部满足才成立; 条件前加 ! 表示颜色不符时成立
+#   末尾 -> N 表示成立时跳到第 N 步, -> N|M 表示不成立时跳到第 M 步 (N 可留空)
+# ---------------------------------------------------------
+COLOR_TOL = 16  # 每个通道允许的差值
+
+class ColorCond:
+    def __init__(self, x, y, w, h, rgb, tol=COLOR_TOL, negate=False):
+        self.x, self.y, self.w, self.h = x, y, w, h
+        self.rgb = rgb
+        self.tol = tol
+        self.negate = negate
+
+def _parse_step(text):
+    text = text.strip()
+    if not text: return None
+    step = int(text)
+    if step < 1: raise ValueError(f"跳转步骤应从 1 开始: {step}")
+    return step
+
+def parse_color_spec(text):
+    # 返回 (条件列表, 成立时跳转, 不成立时跳转), 跳转为 1 起的步骤号或 None; 格式错误抛 ValueError
+    text = str(text)
+    goto = other = None
+    if "->" in text:
+        text, jump = text.rsplit("->", 1)
+        parts = jump.split("|")
+        if len(parts) > 2: raise ValueError(f"跳转格式错误: {jump.strip()}")
+        try:
+            goto = _parse_step(parts[0])
+            if len(parts) == 2: other = _parse_step(parts[1])
+        except ValueError as e: raise ValueError(f"跳转格式错误: {jump.strip()} ({e})") from e
+    conds = []
+    for item in text.split(";"):
+        item = item.strip()
+        if not item: continue
+        negate = item.startswith("!")
+        fields = [f.strip() for f in item.lstrip("!").split(",")]
+        pos = next((i for i, f in enumerate(fields) if f.startswith("#")), -1)
+        if pos not in (2, 4) or len(fields) > pos + 2: raise ValueError(f"取色条件格式错误: {item}")
+        color = fields[pos][1:]
+        try:
+            nums = [int(f) for f in fields[:pos]]
+            rgb = (int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16))
+            tol = int(fields[pos + 1]) if len(fields) > pos + 1 else COLOR_TOL
+        except (ValueError, IndexError): raise ValueError(f"取色条件格式错误: {item}") from None
+        if len(color) != 6: raise ValueError(f"颜色应为 #RRGGBB: {fields[pos]}")
+        if tol < 0: raise ValueError(f"容差不能为负数: {item}")
+        x, y, w, h = nums if pos == 4 else nums + [1, 1]
+        if w < 1 or h < 1: raise ValueError(f"区域宽高应大于 0: {item}")
+        conds.append(ColorCond(x, y, w, h, rgb, tol, negate))
+    if not conds: raise ValueError("没有取色条件")
+    return conds, goto, other
+
+def color_bbox(conds):
+    # 所有条件的外接矩形 (x, y, w, h), 一次截图取完
+    x0 = min(c.x for c in conds)
+    y0 = min(c.y for c in conds)
+    x1 = max(c.x + c.w for c in conds)
+    y1 = max(c.y + c.h for c in conds)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+def sample_colors(rgb_img, conds, x0, y0):
+    # rgb_img: 外接矩形的截图 (H, W, 3); 返回每个条件的平均颜色
+    out = []
+    for c in conds:
+        patch = rgb_img[c.y - y0:c.y - y0 + c.h, c.x - x0:c.x - x0 + c.w, :3]
+        out.append(tuple(int(round(v)) for v in patch.reshape(-1, 3).mean(axis=0)))
+    return out
+
+def colors_match(samples, conds):
+    for rgb, c in zip(samples, conds):
+        ok = max(abs(a - b) for a, b in zip(rgb, c.rgb)) <= c.tol
+        if ok == c.negate: return False
+    return True
+
+def format_rgb(rgb):
+    return "#%02X%02X%02X" % tuple(rgb)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import queue
+import threading
+
+from .utils import write_log
+
+# ---------------------------------------------------------
+# 截图后台写盘: 截图指令只负责截帧, 编码/写文件交给后台线程
+# 队列有上限, 写盘跟不上时截图指令阻塞等待 (背压), 不会无限占内存
+# ---------------------------------------------------------
+FORMATS = {"png": "PNG", "jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP", "bmp": "BMP"}
+
+def save_options(fmt, quality, compress):
+    # PIL.Image.save 的参数: png 用压缩级别 (0-9, 越小越快), jpg/webp 用质量 (1-100)
+    if fmt == "PNG": return {"compress_level": min(max(int(compress), 0), 9)}
+    if fmt in ("JPEG", "WEBP"): return {"quality": min(max(int(quality), 1), 100)}
+    return {}
+
+def format_for(path, default="png"):
+    # 路径带已知扩展名时按扩展名, 否则用默认格式
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    return FORMATS.get(ext) or FORMATS.get(default.lower(), "PNG")
+
+class ImageWriter:
+    def __init__(self, workers=1, max_queue=8):
+        self.queue = queue.Queue(max_queue)
+        self.workers = []
+        self.written = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        for i in range(max(workers, 1)):
+            t = threading.Thread(target=self._work, name=f"image-writer-{i}", daemon=True)
+            t.start()
+            self.workers.append(t)
+
+    def submit(self, img, path, fmt="PNG", options=None, stop_check=None):
+        # 返回因队列满而等待的秒数; stop_check 返回 True 时放弃这张
+        t0 = time.perf_counter()
+        job = (img, path, fmt, options or {})
+        while True:
+            try:
+                self.queue.put(job, timeout=0.05)
+                break
+            except queue.Full:
+                if stop_check and stop_check(): return time.perf_counter() - t0
+        return time.perf_counter() - t0
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:  # close() 发来的结束标记
+                self.queue.task_done()
+                return
+            img, path, fmt, options = job
+            try:
+                if fmt == "JPEG" and img.mode not in ("RGB", "L"): img = img.convert("RGB")
+                img.save(path, format=fmt, **options)
+                with self.lock: self.written += 1
+            except Exception as e:
+                with self.lock: self.failed += 1
+                write_log(f"截图保存失败: {path} ({e})")
+            finally:
+                self.queue.task_done()
+
+    def pending(self):
+        return self.queue.unfinished_tasks
+
+    def close(self, timeout=10.0):
+        # 写完队列里的截图后结束后台线程
+        self.flush(timeout)
+        for _ in self.workers: self.queue.put(None)
+        for t in self.workers: t.join(timeout)
+
+    def flush(self, timeout=10.0):
+        # 等待队列里的截图写完, 超时返回 False
+        deadline = time.time() + timeout
+        while self.queue.unfinished_tasks:
+            if time.time() >= deadline: return False
+            time.sleep(0.01)
+        return True